@@ -0,0 +1,79 @@
+"""
+Bytes per live battle: old dict with ORM rounds vs slotted LiveBattle
+
+    $ python -m benchmarks.battle_memory [battles, default 100000] [rounds, default 5]
+"""
+
+import sys
+import tracemalloc
+
+from db import Move, Round
+from db.move import Choice
+from services.battles import LiveBattle
+
+
+class Player:
+    __slots__ = ("sid", "address")
+
+    def __init__(self, index: int):
+        self.sid = f"sid{index}"
+        self.address = f"0x{index:040x}"
+
+
+def dict_battle(battle_id: int, creator, acceptor, rounds: int) -> dict:
+    """Battle as it was kept before - ORM rounds with ORM moves"""
+    log = []
+    for number in range(1, rounds + 1):
+        round_of_battle = Round(round_number=number, battle_id=battle_id)
+        for player in (creator, acceptor):
+            move = Move(owner_address=player.address, choice=Choice.attack)
+            round_of_battle.moves.append(move)
+        round_of_battle.winner_user_address = "no_one"
+        round_of_battle.winner_sid = "no_one"
+        log.append(round_of_battle)
+    return {
+        "creator": creator,
+        "acceptor": acceptor,
+        "log": log,
+        "state": 2,
+        "creator_hp": 100,
+        "acceptor_hp": 100,
+    }
+
+
+def live_battle(battle_id: int, creator, acceptor, rounds: int) -> LiveBattle:
+    battle = LiveBattle(creator, 2)
+    battle.acceptor = acceptor
+    for _ in range(rounds):
+        battle.set_choice(creator.address, Choice.attack)
+        battle.set_choice(acceptor.address, Choice.attack)
+        battle.finish_round()
+    return battle
+
+
+def measure(make, count: int, rounds: int, players: list) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    battles = {
+        i: make(i, players[2 * i], players[2 * i + 1], rounds) for i in range(count)
+    }
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del battles
+    return used / count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    # Players are shared by both layouts, they are not counted
+    players = [Player(i) for i in range(2 * count)]
+
+    print(f"{count} battles, {rounds} rounds each")
+    print(f"{'layout':<14}{'bytes/battle':>14}")
+    for name, make in (("dict + ORM", dict_battle), ("LiveBattle", live_battle)):
+        print(f"{name:<14}{measure(make, count, rounds, players):>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
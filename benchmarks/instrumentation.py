@@ -0,0 +1,51 @@
+"""
+Overhead of Metrics.instrument per handler call: bare coroutine handler
+vs instrumented one, with small dict payload and JSON string response.
+
+    $ python -m benchmarks.instrumentation [calls, default 200000]
+"""
+
+import asyncio
+import sys
+import time
+
+from services.metrics import Metrics
+
+DATA = {"battle_id": 1, "choice": 2}
+
+
+async def handler(sid, data):
+    return '{"id": 1, "battle_state": 2}'
+
+
+async def error_handler(sid, data):
+    return ("wrong_input", "Choice must be 1, 2 or 3")
+
+
+async def measure(func, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        await func("sid", DATA)
+    return (time.perf_counter() - started) / calls
+
+
+async def run(calls: int):
+    metrics = Metrics()
+    print(f"{calls} calls")
+    print(f"{'handler':<14}{'bare us':>10}{'instrumented us':>18}{'overhead us':>14}")
+    for name, func in (("json response", handler), ("error tuple", error_handler)):
+        bare = await measure(func, calls)
+        instrumented = await measure(metrics.instrument(name, func), calls)
+        print(
+            f"{name:<14}{bare * 1e6:>10.2f}{instrumented * 1e6:>18.2f}"
+            f"{(instrumented - bare) * 1e6:>14.2f}"
+        )
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    asyncio.run(run(calls))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""
+Load test of the real Socket.IO event flow. Server is started in
+subprocess (server.create_app) with stubbed NFT RPC and temp SQLite file,
+simulated clients play whole battles in pairs:
+
+    connect -> verify_signature -> create_battle_offer / accept_offer ->
+    start_battle -> make_move ... until battle_ended -> disconnect
+
+Per-event throughput and p50/p99 latencies are printed and saved as JSON,
+passing previous results as baseline prints the difference.
+Clients run on the same machine (and sign session keys there),
+so results are comparable only between runs on the same machine.
+
+    $ python -m benchmarks.load_test --clients 1000 --out load.json
+    $ python -m benchmarks.load_test --clients 1000 --baseline load.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import signal
+import socket
+import subprocess  # nosec
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import socketio  # type: ignore
+from eth_account import Account  # type: ignore
+from eth_account.messages import encode_defunct  # type: ignore
+
+CALL_TIMEOUT = 60
+
+
+class StubProvider:
+    """NFT contract answering tokenURI/baseURI calls without network"""
+
+    def __init__(self, latency: float = 0):
+        self.latency = latency
+
+    async def call(self, rpc_url: str, contract: str, data: str) -> str:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        uri = f"ipfs://load-test/{contract}/".encode()
+        padded = uri + b"\0" * (-len(uri) % 32)
+        return (
+            "0x"
+            + (32).to_bytes(32, "big").hex()
+            + len(uri).to_bytes(32, "big").hex()
+            + padded.hex()
+        )
+
+
+def serve(args):
+    os.environ["DB_FILE"] = args.db
+    import server
+
+    server.nft_resolver.set_provider(StubProvider(args.rpc_latency / 1000))
+    app = server.create_app()
+    app.run("127.0.0.1", args.port, single_process=True, access_log=False, motd=False)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, directory: str) -> subprocess.Popen:
+    db_file = os.path.join(directory, "load.sqlite")
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.load_test",
+        "--serve",
+        "--port",
+        str(args.port),
+        "--db",
+        db_file,
+        "--rpc-latency",
+        str(args.rpc_latency),
+    ]
+    # Server output goes to file, so it doesn't mix with results
+    log = open(os.path.join(directory, "server.log"), "w")
+    return subprocess.Popen(command, stdout=log, stderr=log)  # nosec
+
+
+async def wait_port(port: int, timeout: float = 30):
+    """Waiting for HTTP response - port is bound before startup listeners end"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET /metrics HTTP/1.0\r\n\r\n")
+            response = await reader.read(12)
+            writer.close()
+            if response.startswith(b"HTTP/"):
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+        await asyncio.sleep(0.1)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.battles = 0
+        # Exception name -> battles which were not played till the end
+        self.failed_flows = defaultdict(int)
+
+    async def call(self, client: socketio.AsyncClient, event: str, data=None):
+        started = time.perf_counter()
+        try:
+            response = await client.call(event, data, timeout=CALL_TIMEOUT)
+        except Exception:
+            self.errors[event] += 1
+            raise
+        self.latencies[event].append(time.perf_counter() - started)
+        if isinstance(response, tuple):
+            status = response[0]
+            if status == "wrong_input" or status.endswith("error"):
+                self.errors[event] += 1
+                raise RuntimeError(f"{event}: {response}")
+        return response
+
+    def record(self, event: str, started: float):
+        self.latencies[event].append(time.perf_counter() - started)
+
+    def summary(self, elapsed: float) -> dict:
+        events = {}
+        for event in sorted(set(self.latencies) | set(self.errors)):
+            latencies = sorted(self.latencies[event])
+            events[event] = {
+                "count": len(latencies),
+                "errors": self.errors[event],
+                "per_second": len(latencies) / elapsed,
+                "p50_ms": percentile(latencies, 0.5) * 1000,
+                "p99_ms": percentile(latencies, 0.99) * 1000,
+                "max_ms": latencies[-1] * 1000 if latencies else 0,
+            }
+        return events
+
+
+def percentile(values: list, share: float) -> float:
+    if not values:
+        return 0
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+class Player:
+    def __init__(self, url: str, recorder: Recorder):
+        self.url = url
+        self.recorder = recorder
+        self.account = Account.create()
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.session_key = asyncio.get_running_loop().create_future()
+        self.rounds: asyncio.Queue = asyncio.Queue()
+        self.ended = asyncio.get_running_loop().create_future()
+        self.started = asyncio.get_running_loop().create_future()
+        self.sio.on("session_key", self._on_session_key)
+        self.sio.on("round_ended", self.rounds.put_nowait)
+        self.sio.on("battle_ended", self._on_battle_ended)
+        self.sio.on("started_battle", self._on_started_battle)
+
+    async def _on_session_key(self, data):
+        if not self.session_key.done():
+            self.session_key.set_result(data["session_key"])
+
+    async def _on_battle_ended(self, data):
+        if not self.ended.done():
+            self.ended.set_result(data)
+
+    async def _on_started_battle(self, data):
+        if not self.started.done():
+            self.started.set_result(json.loads(data))
+
+    async def login(self):
+        started = time.perf_counter()
+        try:
+            await self.sio.connect(self.url, transports=["websocket"])
+            session_key = await asyncio.wait_for(self.session_key, CALL_TIMEOUT)
+        except Exception:
+            self.recorder.errors["connect"] += 1
+            raise
+        self.recorder.record("connect", started)
+
+        # Signing is client work, not measured
+        signature = self.account.sign_message(encode_defunct(text=session_key))
+        await self.recorder.call(
+            self.sio,
+            "verify_signature",
+            {
+                "address": self.account.address,
+                "signature": signature.signature.hex(),
+            },
+        )
+
+    async def move(self):
+        await self.recorder.call(
+            self.sio, "make_move", {"choice": random.randint(1, 3)}
+        )
+
+    async def disconnect(self):
+        started = time.perf_counter()
+        await self.sio.disconnect()
+        self.recorder.record("disconnect", started)
+
+
+async def play_battle(creator: Player, acceptor: Player, recorder: Recorder):
+    call = recorder.call
+    await asyncio.gather(creator.login(), acceptor.login())
+
+    battle = json.loads(
+        await call(
+            creator.sio, "create_battle_offer", {"nft_type": 0, "nft_id": 1, "bet": "1"}
+        )
+    )
+    accept = json.loads(
+        await call(
+            acceptor.sio,
+            "accept_offer",
+            {"nft_type": 1, "nft_id": 2, "battle_id": battle["id"]},
+        )
+    )
+    await call(
+        creator.sio,
+        "start_battle",
+        {"battle_id": battle["id"], "accept_id": accept["id"]},
+    )
+    await acceptor.started
+
+    while True:
+        started = time.perf_counter()
+        await asyncio.gather(creator.move(), acceptor.move())
+        result, _ = await asyncio.gather(creator.rounds.get(), acceptor.rounds.get())
+        # Both moves sent -> both players got round result
+        recorder.record("round", started)
+        if result["left_hp"] <= 0 or result["right_hp"] <= 0:
+            break
+    await asyncio.gather(creator.ended, acceptor.ended)
+    recorder.battles += 1
+
+
+async def run_pair(url: str, recorder: Recorder, semaphore: asyncio.Semaphore):
+    async with semaphore:
+        creator, acceptor = Player(url, recorder), Player(url, recorder)
+        try:
+            await play_battle(creator, acceptor, recorder)
+        except Exception as e:
+            recorder.failed_flows[type(e).__name__] += 1
+        finally:
+            for player in (creator, acceptor):
+                if player.sio.connected:
+                    await player.disconnect()
+
+
+async def run_load(args) -> dict:
+    url = f"http://127.0.0.1:{args.port}"
+    await wait_port(args.port)
+    recorder = Recorder()
+    semaphore = asyncio.Semaphore(args.concurrency // 2 or 1)
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(run_pair(url, recorder, semaphore) for _ in range(args.clients // 2))
+    )
+    elapsed = time.perf_counter() - started
+    return {
+        "config": {
+            "clients": args.clients,
+            "concurrency": args.concurrency,
+            "rpc_latency_ms": args.rpc_latency,
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+        },
+        "elapsed": elapsed,
+        "battles": recorder.battles,
+        "failed_flows": dict(recorder.failed_flows),
+        "events": recorder.summary(elapsed),
+    }
+
+
+def print_results(results: dict, baseline: dict = None):
+    failed = results["failed_flows"]
+    print(
+        f"{results['config']['clients']} clients, {results['battles']} battles, "
+        f"{sum(failed.values())} failed {json.dumps(failed)}, "
+        f"{results['elapsed']:.1f} s"
+    )
+    columns = f"{'event':<22}{'count':>8}{'errors':>8}{'per s':>10}"
+    print(f"{columns}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for event, stats in results["events"].items():
+        line = (
+            f"{event:<22}{stats['count']:>8}{stats['errors']:>8}"
+            f"{stats['per_second']:>10.0f}{stats['p50_ms']:>10.1f}"
+            f"{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}"
+        )
+        old = (baseline or {}).get("events", {}).get(event)
+        if old and old["p99_ms"]:
+            line += f"  p99 {stats['p99_ms'] / old['p99_ms'] - 1:+.0%}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument(
+        "--concurrency", type=int, default=1000, help="clients connected at once"
+    )
+    parser.add_argument("--rpc-latency", type=float, default=0, help="ms per call")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--out", help="file to save JSON results")
+    parser.add_argument("--baseline", help="previous JSON results to compare")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    args.port = args.port or free_port()
+    directory = tempfile.mkdtemp()
+    process = start_server(args, directory)
+    try:
+        results = asyncio.run(run_load(args))
+    finally:
+        process.send_signal(signal.SIGINT)
+        process.wait()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    print_results(results, baseline)
+    print(f"Server log: {os.path.join(directory, 'server.log')}")
+    if args.out:
+        with open(args.out, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Menu-heavy lobby load: players mostly refresh battles and accepts lists,
+sometimes create battles and accept them. Same mix with and without
+query cache - share of reads served without DB and reads per second.
+
+    $ python -m benchmarks.lobby_cache [operations, default 20000]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+import sqlalchemy as sa  # type: ignore
+import sqlalchemy.orm as orm  # type: ignore
+
+from db import Accept, Battle, SqlAlchemyBase
+from db.pagination import keyset_page
+from db.serializers import accept_encoder, battle_encoder
+from services.query_cache import QueryCache
+
+PLAYERS = 200
+BATTLES_PER_PLAYER = 5
+# Share of operations which change lobby (create battle / accept)
+WRITES = 0.05
+
+
+def fill(factory):
+    db_sess = factory()
+    db_sess.bulk_insert_mappings(
+        Battle,
+        [
+            {
+                "nft_id": i,
+                "nft_type": "bot",
+                "bet": "10",
+                "battle_state": "listed",
+                "owner_address": f"0x{i % PLAYERS:040x}",
+            }
+            for i in range(PLAYERS * BATTLES_PER_PLAYER)
+        ],
+    )
+    db_sess.commit()
+    db_sess.close()
+
+
+def battles_page(db_sess, address):
+    query = battle_encoder.query(db_sess).filter(Battle.owner_address == address)
+    return keyset_page(battle_encoder, query, Battle.id, None, 20)
+
+
+def accepts_page(db_sess, battle_id):
+    query = accept_encoder.query(db_sess).filter(Accept.battle_id == battle_id)
+    return keyset_page(accept_encoder, query, Accept.id, None, 20)
+
+
+def write(db_sess, cache: QueryCache, rnd: random.Random, battle_ids: list):
+    owner = f"0x{rnd.randrange(PLAYERS):040x}"
+    if rnd.random() < 0.5:
+        battle = Battle(nft_id=0, nft_type="bot", bet="10", owner_address=owner)
+        battle.battle_state = "listed"
+        db_sess.add(battle)
+        db_sess.commit()
+        battle_ids.append(battle.id)
+        cache.invalidate(("battles", owner))
+    else:
+        battle_id = rnd.choice(battle_ids)
+        db_sess.add(
+            Accept(nft_id=0, nft_type="bot", battle_id=battle_id, owner_address=owner)
+        )
+        db_sess.commit()
+        cache.invalidate(("accepts", battle_id))
+
+
+def run(factory, cache: QueryCache, operations: int):
+    rnd = random.Random(1)
+    battle_ids = list(range(1, PLAYERS * BATTLES_PER_PLAYER + 1))
+    db_sess = factory()
+    reads = db_reads = 0
+    read_time = 0.0
+    for _ in range(operations):
+        if rnd.random() < WRITES:
+            write(db_sess, cache, rnd, battle_ids)
+            continue
+
+        if rnd.random() < 0.5:
+            tag = ("battles", f"0x{rnd.randrange(PLAYERS):040x}")
+            query_page = battles_page
+        else:
+            tag = ("accepts", rnd.choice(battle_ids))
+            query_page = accepts_page
+        started = time.perf_counter()
+        reads += 1
+        if cache.get(tag) is None:
+            db_reads += 1
+            generation = cache.generation(tag)
+            page = query_page(db_sess, tag[1])
+            db_sess.expunge_all()
+            cache.put(tag, tag, generation, page, weight=max(len(page[0]), 1))
+        read_time += time.perf_counter() - started
+    db_sess.close()
+    return reads, db_reads, read_time
+
+
+def main():
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f"{operations} operations, {PLAYERS} players, {WRITES:.0%} writes")
+    print(f"{'cache':<12}{'reads':>10}{'db reads':>10}{'skip db':>10}{'reads/s':>12}")
+    for name, max_weight in (("disabled", 0), ("enabled", 100000)):
+        db_file = os.path.join(tempfile.mkdtemp(), "bench.sqlite")
+        engine = sa.create_engine(f"sqlite:///{db_file}")
+        SqlAlchemyBase.metadata.create_all(engine)
+        factory = orm.sessionmaker(bind=engine)
+        fill(factory)
+
+        cache = QueryCache(max_weight)
+        reads, db_reads, read_time = run(factory, cache, operations)
+        skipped = 1 - db_reads / reads
+        print(
+            f"{name:<12}{reads:>10}{db_reads:>10}{skipped:>10.0%}"
+            f"{reads / read_time:>12.0f}"
+        )
+        if max_weight:
+            print(cache.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Matchmaking: enqueues per second of in-memory bet tier queue and
+DB cost of match - offer/accept/start (3 transactions) vs matched
+battle with its accept in one transaction.
+
+    $ python -m benchmarks.matchmaking [players, default 200000]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+import sqlalchemy as sa  # type: ignore
+import sqlalchemy.orm as orm  # type: ignore
+
+from db import Accept, Battle, BattleState, SqlAlchemyBase
+from services.matchmaking import MatchQueue
+
+MATCHES = 2000
+
+
+def queue_throughput(players: int):
+    queue = MatchQueue()
+    rnd = random.Random(1)
+    bets = [str(rnd.choice((0.5, 5, 50, 500, 5000))) for _ in range(players)]
+    tickets = [
+        queue.ticket(f"sid{i}", f"0x{i:040x}", 0, i, bet) for i, bet in enumerate(bets)
+    ]
+    started = time.perf_counter()
+    for ticket in tickets:
+        queue.enqueue(ticket)
+    elapsed = time.perf_counter() - started
+    print(
+        f"queue: {players / elapsed:.0f} enqueues/s, "
+        f"{queue.matched // 2} matches, {len(queue)} waiting"
+    )
+
+
+def battle(i: int) -> Battle:
+    return Battle(
+        owner_address=f"0x{i:040x}",
+        nft_id=i,
+        nft_type="bot",
+        bet="10",
+        battle_state=BattleState.listed,
+    )
+
+
+def accept(i: int, battle_id: int) -> Accept:
+    return Accept(
+        owner_address=f"0x{i + 1:040x}", nft_id=i, nft_type="bot", battle_id=battle_id
+    )
+
+
+def offer_accept_start(factory, i: int):
+    db_sess = factory()
+    battle_db = battle(i)
+    db_sess.add(battle_db)
+    db_sess.commit()
+    accept_db = accept(i, battle_db.id)
+    db_sess.add(accept_db)
+    db_sess.commit()
+    battle_db.battle_state = BattleState.in_battle
+    battle_db.accepted_id = accept_db.id
+    db_sess.commit()
+    db_sess.close()
+
+
+def matched(factory, i: int):
+    db_sess = factory()
+    battle_db = battle(i)
+    battle_db.battle_state = BattleState.in_battle
+    db_sess.add(battle_db)
+    db_sess.flush()
+    accept_db = accept(i, battle_db.id)
+    db_sess.add(accept_db)
+    db_sess.flush()
+    battle_db.accepted_id = accept_db.id
+    db_sess.commit()
+    db_sess.close()
+
+
+def main():
+    players = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    queue_throughput(players)
+
+    for name, create in (
+        ("offer/accept/start", offer_accept_start),
+        ("matched", matched),
+    ):
+        db_file = os.path.join(tempfile.mkdtemp(), "bench.sqlite")
+        engine = sa.create_engine(f"sqlite:///{db_file}")
+        SqlAlchemyBase.metadata.create_all(engine)
+        factory = orm.sessionmaker(bind=engine, expire_on_commit=False)
+
+        started = time.perf_counter()
+        for i in range(MATCHES):
+            create(factory, i)
+        elapsed = time.perf_counter() - started
+        print(f"{name:<20}{MATCHES / elapsed:>10.0f} battles/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Lobby queries latency on big history, before and after db.migrations.upgrade
+
+    $ python -m benchmarks.query_indexes [battles count, default 1000000]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+import sqlalchemy as sa  # type: ignore
+import sqlalchemy.orm as orm  # type: ignore
+
+from db import Accept, Battle, BattleState, Round, SqlAlchemyBase
+from db.migrations import upgrade
+
+OWNERS = 10000
+REPEATS = 200
+
+
+def fill(engine, count: int):
+    """Battles mostly ended, ~1% listed; accepts and rounds for every 2nd"""
+    owners = [f"0x{i:040x}" for i in range(OWNERS)]
+    states = [BattleState.ended.name] * 95 + [BattleState.in_battle.name] * 4
+    states += [BattleState.listed.name]
+    with engine.begin() as conn:
+        for start in range(0, count, 50000):
+            ids = range(start + 1, min(start + 50000, count) + 1)
+            conn.execute(
+                Battle.__table__.insert(),
+                [
+                    {
+                        "id": i,
+                        "nft_id": i,
+                        "nft_type": "bot",
+                        "bet": str(i % 100),
+                        "battle_state": random.choice(states),  # nosec
+                        "owner_address": random.choice(owners),  # nosec
+                    }
+                    for i in ids
+                ],
+            )
+            conn.execute(
+                Accept.__table__.insert(),
+                [{"battle_id": i, "nft_id": i, "nft_type": "shroom"} for i in ids[::2]],
+            )
+            conn.execute(
+                Round.__table__.insert(),
+                [{"battle_id": i, "round_number": 1} for i in ids[::2]],
+            )
+
+
+def drop_indexes(engine):
+    with engine.begin() as conn:
+        for table in SqlAlchemyBase.metadata.sorted_tables:
+            for index in table.indexes:
+                index.drop(conn, checkfirst=True)
+        conn.exec_driver_sql("PRAGMA user_version = 0")
+
+
+QUERIES = {
+    "get_battles_list": lambda s, n: s.query(Battle)
+    .filter(Battle.owner_address == f"0x{n % OWNERS:040x}")
+    .all(),
+    "get_recommended_battles": lambda s, n: s.query(Battle.id)
+    .filter(Battle.battle_state == BattleState.listed)
+    .filter(Battle.owner_address != f"0x{n % OWNERS:040x}")
+    .count(),
+    "accepts_list": lambda s, n: s.query(Accept).filter(Accept.battle_id == n).all(),
+    "get_battle_log": lambda s, n: s.query(Round).filter(Round.battle_id == n).all(),
+}
+
+
+def measure(factory, count: int) -> dict:
+    result = {}
+    for name, query in QUERIES.items():
+        # Recommendations scan all listed battles, less repeats for it
+        repeats = REPEATS // 20 if name == "get_recommended_battles" else REPEATS
+        db_sess = factory()
+        started = time.perf_counter()
+        for _ in range(repeats):
+            query(db_sess, random.randint(1, count))  # nosec
+        result[name] = (time.perf_counter() - started) / repeats * 1000
+        db_sess.close()
+    return result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    db_file = os.path.join(tempfile.mkdtemp(), "bench.sqlite")
+    engine = sa.create_engine(f"sqlite:///{db_file}")
+    factory = orm.sessionmaker(bind=engine)
+
+    SqlAlchemyBase.metadata.create_all(engine)
+    drop_indexes(engine)
+    print(f"Filling {count} battles into {db_file}")
+    fill(engine, count)
+
+    before = measure(factory, count)
+    started = time.perf_counter()
+    upgrade(engine)
+    print(f"Migration took {time.perf_counter() - started:.1f}s")
+    after = measure(factory, count)
+
+    print(f"{'query':<26}{'before, ms':>12}{'after, ms':>12}")
+    for name in QUERIES:
+        print(f"{name:<26}{before[name]:>12.3f}{after[name]:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
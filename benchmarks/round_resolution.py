@@ -0,0 +1,58 @@
+"""
+Round resolution: old if/else chain vs outcome table vs batched NumPy
+
+    $ python -m benchmarks.round_resolution [rounds, default 1000000]
+"""
+
+import random
+import sys
+import time
+
+from db.move import Choice
+from db.resolution import resolve, resolve_many
+
+
+def resolve_if_else(first, second) -> int:
+    """Game logic as it was written in make_move and Round"""
+    if first == second:
+        return 0
+    if first == Choice.attack:
+        return 1 if second == Choice.trick else -1
+    elif first == Choice.trick:
+        return 1 if second == Choice.block else -1
+    elif first == Choice.block:
+        return 1 if second == Choice.attack else -1
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    choices = list(Choice)
+    firsts = [random.choice(choices) for _ in range(count)]  # nosec
+    seconds = [random.choice(choices) for _ in range(count)]  # nosec
+
+    results = {}
+    started = time.perf_counter()
+    expected = [resolve_if_else(a, b) for a, b in zip(firsts, seconds)]
+    results["if/else"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    outcomes = [resolve(a, b) for a, b in zip(firsts, seconds)]
+    results["table"] = time.perf_counter() - started
+    assert outcomes == expected
+
+    import numpy as np  # type: ignore
+
+    first_array = np.array(firsts, dtype=np.int8)
+    second_array = np.array(seconds, dtype=np.int8)
+    started = time.perf_counter()
+    batch = resolve_many(first_array, second_array)
+    results["numpy batch"] = time.perf_counter() - started
+    assert batch.tolist() == expected
+
+    print(f"{'engine':<14}{'total, ms':>12}{'ns/round':>12}")
+    for name, elapsed in results.items():
+        print(f"{name:<14}{elapsed * 1000:>12.1f}{elapsed / count * 1e9:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Battles list encoding: pydantic per ORM row + json.dumps vs row encoders
+with each codec. Rows per second and bytes of Socket.IO ack packet.
+
+    $ python -m benchmarks.serialization [battles, default 1000]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+import sqlalchemy as sa  # type: ignore
+import sqlalchemy.orm as orm  # type: ignore
+from socketio import packet  # type: ignore
+
+from db import Battle, PydanticBattle, SqlAlchemyBase
+from db.serializers import battle_encoder
+from services import codecs
+
+REPEATS = 20
+
+
+def fill(factory, count: int):
+    db_sess = factory()
+    db_sess.bulk_insert_mappings(
+        Battle,
+        [
+            {
+                "nft_id": i,
+                "nft_type": "bot",
+                "bet": str(i % 100),
+                "battle_state": "listed",
+                "owner_address": f"0x{1:040x}",
+            }
+            for i in range(count)
+        ],
+    )
+    db_sess.commit()
+    db_sess.close()
+
+
+def pydantic_path(db_sess):
+    dict_battles = []
+    for battle in db_sess.query(Battle).all():
+        dict_battle = PydanticBattle.from_orm(battle).dict()
+        dict_battle["uri"] = battle.uri
+        dict_battles.append(dict_battle)
+    return json.dumps(dict_battles)
+
+
+def encoder_path(codec: str):
+    def encode(db_sess):
+        return codecs.encode(codec, battle_encoder.all(battle_encoder.query(db_sess)))
+
+    return encode
+
+
+def wire_bytes(response) -> int:
+    """Size of ack packet carrying response as Socket.IO sends it"""
+    encoded = packet.Packet(packet.ACK, data=[response], id=1).encode()
+    if isinstance(encoded, list):
+        # Text packet + binary attachments
+        return sum(len(part) for part in encoded)
+    return len(encoded.encode())
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    db_file = os.path.join(tempfile.mkdtemp(), "bench.sqlite")
+    engine = sa.create_engine(f"sqlite:///{db_file}")
+    SqlAlchemyBase.metadata.create_all(engine)
+    factory = orm.sessionmaker(bind=engine)
+    fill(factory, count)
+
+    paths = {"pydantic + json": pydantic_path}
+    for codec in codecs.CODECS:
+        paths[f"encoder + {codec}"] = encoder_path(codec)
+
+    print(f"{count} battles, json backend: {'orjson' if codecs.orjson else 'json'}")
+    print(f"{'path':<20}{'rows/s':>12}{'wire bytes':>12}")
+    for name, path in paths.items():
+        db_sess = factory()
+        started = time.perf_counter()
+        for _ in range(REPEATS):
+            response = path(db_sess)
+            # Ack packet is encoded by Socket.IO for every response
+            size = wire_bytes(response)
+            db_sess.expunge_all()
+        elapsed = time.perf_counter() - started
+        db_sess.close()
+        print(f"{name:<20}{count * REPEATS / elapsed:>12.0f}{size:>12}")
+
+
+if __name__ == "__main__":
+    main()
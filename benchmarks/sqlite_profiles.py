@@ -0,0 +1,82 @@
+"""
+Commits per second and read latency under writes for SQLite engine profiles
+
+    $ python -m benchmarks.sqlite_profiles [commits, default 2000]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import sqlalchemy.orm as orm  # type: ignore
+
+from db import Battle, BattleState, SqlAlchemyBase
+from db.database import SQLITE_PROFILES, create_sqlite_engine
+
+READERS = 4
+
+
+def run_profile(profile: str, commits: int) -> dict:
+    db_file = os.path.join(tempfile.mkdtemp(), "bench.sqlite")
+    engine = create_sqlite_engine(db_file, profile)
+    SqlAlchemyBase.metadata.create_all(engine)
+    factory = orm.sessionmaker(bind=engine)
+    read_engine = create_sqlite_engine(
+        db_file,
+        profile,
+        read_only=SQLITE_PROFILES[profile]["separate_readers"],
+        pool_size=READERS,
+    )
+    read_factory = orm.sessionmaker(bind=read_engine)
+
+    stop = threading.Event()
+    read_latencies = []
+
+    def reader():
+        db_sess = read_factory()
+        while not stop.is_set():
+            started = time.perf_counter()
+            db_sess.query(Battle).filter(Battle.owner_address == "0x1").all()
+            db_sess.rollback()
+            read_latencies.append(time.perf_counter() - started)
+        db_sess.close()
+
+    threads = [threading.Thread(target=reader) for _ in range(READERS)]
+    for thread in threads:
+        thread.start()
+
+    # One commit per created battle, as create_battle_offer does
+    db_sess = factory()
+    started = time.perf_counter()
+    for i in range(commits):
+        battle = Battle(owner_address=f"0x{i % 100}", nft_id=i, bet="1")
+        battle.battle_state = BattleState.listed
+        db_sess.add(battle)
+        db_sess.commit()
+    elapsed = time.perf_counter() - started
+    db_sess.close()
+
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    read_latencies.sort()
+    p99 = read_latencies[int(len(read_latencies) * 0.99)] if read_latencies else 0
+    return {"commits_per_s": commits / elapsed, "read_p99_ms": p99 * 1000}
+
+
+def main():
+    commits = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f"{'profile':<10}{'commits/s':>12}{'read p99, ms':>15}")
+    for profile in SQLITE_PROFILES:
+        result = run_profile(profile, commits)
+        print(
+            f"{profile:<10}{result['commits_per_s']:>12.0f}"
+            f"{result['read_p99_ms']:>15.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
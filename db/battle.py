@@ -2,25 +2,11 @@ import sqlalchemy as sa  # type: ignore
 from sqlalchemy import orm, Enum
 from sqlalchemy.ext.hybrid import hybrid_property  # type: ignore
 from enum import IntEnum
+import random
 from .database import SqlAlchemyBase
 from .nft import NFTType
 
-from web3 import Web3
-
-POLYGON_RPC = "https://polygon-rpc.com/"
-ETHEREUM_RPC = "https://nodes.mewapi.io/rpc/eth"
-
-SHROOMS_CONTRACT = "0xD558BF191abfe28CA37885605C7754E77F9DF0eF"
-BOTS_CONTRACT = "0x0111546FEB693b9d9d5886e362472886b71D5337"
-
-NFT_ABI = (
-    '[{ "constant": true, "inputs": [ { "name": "_owner", "type": "address" } ], "name": "balanceOf", '
-    '"outputs": [ { "name": "balance", "type": "uint256" } ], "payable": false, "type": "function" }, '
-    '{ "constant": true, "inputs": [ { "name": "_owner", "type": "address" } ], "name": "walletOfOwner", '
-    '"outputs": [ { "name": "balances", "type": "uint256[]" } ], "payable": false, "type": "function" }, '
-    '{ "constant": true, "inputs": [ { "name": "tokenId", "type": "uint256" } ], "name": "tokenURI", '
-    '"outputs": [ { "name": "uri", "type": "string" } ], "payable": false, "type": "function"}] '
-)
+from .nft_resolver import nft_resolver
 
 
 class BattleState(IntEnum):
@@ -31,6 +17,12 @@ class BattleState(IntEnum):
 
 class Battle(SqlAlchemyBase):
     __tablename__ = "battles"
+    __table_args__ = (
+        # Listed battles not owned by user (recommendations)
+        sa.Index(
+            "ix_battles_battle_state_owner_address", "battle_state", "owner_address"
+        ),
+    )
     id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
 
     nft_id = sa.Column(sa.Integer)
@@ -44,17 +36,34 @@ class Battle(SqlAlchemyBase):
     log = orm.relationship("Round", back_populates="battle")
     battle_state = sa.Column(Enum(BattleState))
 
-    owner_address = sa.Column(sa.String(42), sa.ForeignKey("users.address"))
+    owner_address = sa.Column(sa.String(42), sa.ForeignKey("users.address"), index=True)
 
     @hybrid_property
     def uri(self):
-        polygon = Web3(Web3.HTTPProvider(POLYGON_RPC))
-        ethereum = Web3(Web3.HTTPProvider(ETHEREUM_RPC))
-        if self.nft_type == NFTType.bot:
-            bots = ethereum.eth.contract(BOTS_CONTRACT, abi=NFT_ABI)
-            bots_base_uri = bots.functions.tokenURI(0).call()[:-1]
-            return bots_base_uri + str(self.nft_id)
-        else:
-            shrooms = polygon.eth.contract(SHROOMS_CONTRACT, abi=NFT_ABI)
-            shrooms_base_uri = shrooms.functions.tokenURI(0).call()[:-1]
-            return shrooms_base_uri + str(self.nft_id)
+        # Base uri is cached by resolver - no RPC call per row
+        return nft_resolver.cached_uri(self.nft_type, self.nft_id)
+
+
+def sample_listed_battles(
+    db_sess, k, exclude_owner, nft_type=None, min_bet=None, max_bet=None
+):
+    """
+    Up to k random listed battles picked by random offsets,
+    without loading all of them (fallback of in-memory recommendations)
+    """
+    query = (
+        db_sess.query(Battle)
+        .filter(Battle.battle_state == BattleState.listed)
+        .filter(Battle.owner_address != exclude_owner)
+    )
+    if nft_type is not None:
+        query = query.filter(Battle.nft_type == NFTType(nft_type))
+    if min_bet is not None:
+        query = query.filter(sa.cast(Battle.bet, sa.Float) >= min_bet)
+    if max_bet is not None:
+        query = query.filter(sa.cast(Battle.bet, sa.Float) <= max_bet)
+
+    count = query.count()
+    offsets = random.sample(range(count), min(k, count))  # nosec
+    query = query.order_by(Battle.id)
+    return [query.offset(offset).limit(1).first() for offset in offsets]
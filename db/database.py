@@ -1,19 +1,90 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, TypeVar
+
 import sqlalchemy as sa  # type: ignore
 import sqlalchemy.orm as orm  # type: ignore
 from sqlalchemy.orm import Session
 import sqlalchemy.ext.declarative as dec  # type: ignore
+from sqlalchemy.pool import QueuePool  # type: ignore
 
 SqlAlchemyBase = dec.declarative_base()
 
 __factory = None
+# Sessions on read-only connections (same as __factory if not separated)
+__read_factory = None
 
+# All blocking DB work is done in these pools, never on the event loop.
+# SQLite has single writer, so writes are serialised in one thread
+# and reads can't queue behind them.
+__read_executor = None
+__write_executor = None
+# Called with seconds every run_in_session took (pool queue included)
+__session_timer: Optional[Callable[[float], None]] = None
 
-def _after_init_db():
-    pass
+T = TypeVar("T")
 
+# Engine profiles selected by SQLITE_PROFILE env (or global_init_sqlite arg)
+SQLITE_PROFILES: Dict[str, dict] = {
+    # sqlite defaults: rollback journal, fsync on every commit
+    "default": {"pragmas": {}, "separate_readers": False},
+    # WAL: readers don't block writer, commit fsyncs only on checkpoint
+    "tuned": {
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "mmap_size": 256 * 1024 * 1024,
+            "cache_size": -64 * 1024,  # KiB
+            "busy_timeout": 5000,  # ms
+            "temp_store": "MEMORY",
+        },
+        "separate_readers": True,
+    },
+}
 
-def global_init_sqlite(db_file):
-    global __factory
+
+def _after_init_db(engine):
+    # Existing DB files get indexes and tables added after they were created
+    from .migrations import upgrade
+
+    upgrade(engine)
+
+
+def create_sqlite_engine(
+    db_file: str, profile: str = "tuned", read_only: bool = False, pool_size: int = 1
+):
+    """
+    Engine with pragmas of profile applied to every new connection.
+    Connections are pooled (one per DB thread), so pragmas and page cache
+    are not lost between sessions.
+    """
+    pragmas = SQLITE_PROFILES[profile]["pragmas"]
+    if read_only:
+        conn_str = f"sqlite:///file:{db_file}?mode=ro&uri=true&check_same_thread=False"
+    else:
+        conn_str = f"sqlite:///{db_file}?check_same_thread=False"
+
+    engine = sa.create_engine(
+        conn_str, echo=False, poolclass=QueuePool, pool_size=pool_size, max_overflow=0
+    )
+
+    @sa.event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            if read_only and name == "journal_mode":
+                continue
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+    return engine
+
+
+def global_init_sqlite(db_file, read_workers: int = 4, profile: str = None):
+    global __factory, __read_factory, __read_executor, __write_executor
 
     if __factory:
         return
@@ -21,19 +92,86 @@ def global_init_sqlite(db_file):
     if not db_file or not db_file.strip():
         raise Exception("Required path to your DB.")
 
-    conn_str = f"sqlite:///{db_file.strip()}?check_same_thread=False"
-    print(f"Connecting to db by {conn_str}")
+    profile = profile or os.environ.get("SQLITE_PROFILE", "tuned")
+    if profile not in SQLITE_PROFILES:
+        raise Exception(f"Unknown SQLite profile {profile}.")
+    db_file = db_file.strip()
+    print(f"Connecting to db {db_file} with {profile} profile")
 
-    engine = sa.create_engine(conn_str, echo=False)
-    __factory = orm.sessionmaker(bind=engine, autoflush=True)
+    separate_readers = SQLITE_PROFILES[profile]["separate_readers"]
+    # Single writer connection - it is used by single writer thread,
+    # without separate readers read threads take connections of this pool too
+    engine = create_sqlite_engine(
+        db_file, profile, pool_size=1 if separate_readers else read_workers + 1
+    )
+    # Objects are used after session closed, so they must not expire
+    __factory = orm.sessionmaker(bind=engine, autoflush=True, expire_on_commit=False)
+    __read_factory = __factory
+    __read_executor = ThreadPoolExecutor(
+        max_workers=read_workers, thread_name_prefix="db-read"
+    )
+    __write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
 
     # from . import __all_models
 
     SqlAlchemyBase.metadata.create_all(engine)
 
-    _after_init_db()
+    _after_init_db(engine)
+
+    if separate_readers:
+        read_engine = create_sqlite_engine(
+            db_file, profile, read_only=True, pool_size=read_workers
+        )
+        __read_factory = orm.sessionmaker(bind=read_engine, expire_on_commit=False)
 
 
 def create_session() -> Session:
     global __factory
     return __factory()  # type: ignore
+
+
+@contextmanager
+def session_scope(read_only: bool = False) -> Iterator[Session]:
+    """Session committed on success, rolled back on error and always closed"""
+    db_sess = __read_factory() if read_only else create_session()  # type: ignore
+    try:
+        yield db_sess
+        db_sess.commit()
+    except BaseException:
+        db_sess.rollback()
+        raise
+    finally:
+        db_sess.close()
+
+
+async def run_in_session(
+    func: Callable[..., T], *args, read_only: bool = False, **kwargs
+) -> T:
+    """
+    Running func(db_sess, *args, **kwargs) in DB thread pool inside session scope.
+    func must return plain data or loaded objects - lazy loading
+    after session closed is not possible.
+    """
+
+    def job():
+        with session_scope(read_only) as db_sess:
+            return func(db_sess, *args, **kwargs)
+
+    executor = __read_executor if read_only else __write_executor
+    started = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, job)
+    finally:
+        if __session_timer is not None:
+            __session_timer(time.perf_counter() - started)
+
+
+def set_session_timer(timer: Optional[Callable[[float], None]]):
+    global __session_timer
+    __session_timer = timer
+
+
+def shutdown_executors(wait: bool = True):
+    for executor in (__read_executor, __write_executor):
+        if executor is not None:
+            executor.shutdown(wait=wait)
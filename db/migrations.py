@@ -0,0 +1,41 @@
+import sys
+
+from .database import SqlAlchemyBase
+
+# Stored in sqlite "PRAGMA user_version"
+# 1 - indexes on battles, accepts, rounds and moves lookup columns
+# 2 - index on session_keys.created (expiry)
+SCHEMA_VERSION = 2
+
+
+def get_schema_version(conn) -> int:
+    return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def upgrade(engine) -> int:
+    """
+    Upgrading DB to SCHEMA_VERSION.
+    `create_all` skips existing tables, so indexes declared later
+    are created here one by one.
+    """
+    with engine.begin() as conn:
+        version = get_schema_version(conn)
+        if version >= SCHEMA_VERSION:
+            return version
+
+        SqlAlchemyBase.metadata.create_all(conn)
+        for table in SqlAlchemyBase.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+        # Statistics for query planner to pick new indexes
+        conn.exec_driver_sql("ANALYZE")
+        conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return SCHEMA_VERSION
+
+
+if __name__ == "__main__":
+    # python -m db.migrations db.sqlite
+    from db import database
+
+    database.global_init_sqlite(sys.argv[1] if len(sys.argv) > 1 else "db.sqlite")
@@ -19,7 +19,7 @@ class Move(SqlAlchemyBase):
 
     owner_address = sa.Column(sa.String(42), sa.ForeignKey("users.address"))
 
-    round_id = sa.Column(sa.Integer, sa.ForeignKey("rounds.id"))
+    round_id = sa.Column(sa.Integer, sa.ForeignKey("rounds.id"), index=True)
     round = orm.relationship("Round", back_populates="moves")
 
     choice = sa.Column(Enum(Choice))
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+import aiohttp  # type: ignore
+
+from .nft import NFTType
+
+POLYGON_RPC = os.environ.get("POLYGON_RPC", "https://polygon-rpc.com/")
+ETHEREUM_RPC = os.environ.get("ETHEREUM_RPC", "https://nodes.mewapi.io/rpc/eth")
+
+SHROOMS_CONTRACT = "0xD558BF191abfe28CA37885605C7754E77F9DF0eF"
+BOTS_CONTRACT = "0x0111546FEB693b9d9d5886e362472886b71D5337"
+
+# keccak("tokenURI(uint256)")[:4]
+TOKEN_URI_SELECTOR = "0xc87b56dd"
+
+# NFT type -> (rpc url, contract address)
+NFT_CONTRACTS = {
+    NFTType.bot: (ETHEREUM_RPC, BOTS_CONTRACT),
+    NFTType.shroom: (POLYGON_RPC, SHROOMS_CONTRACT),
+}
+
+
+def decode_abi_string(result: str) -> str:
+    """Decoding single ABI encoded `string` returned by eth_call"""
+    raw = bytes.fromhex(result[2:] if result.startswith("0x") else result)
+    offset = int.from_bytes(raw[:32], "big")
+    length = int.from_bytes(raw[offset : offset + 32], "big")
+    return raw[offset + 32 : offset + 32 + length].decode("utf-8")
+
+
+class JsonRpcProvider:
+    """
+    Async provider making raw `eth_call` requests to JSON-RPC node.
+    Can be replaced with any object having same `call` coroutine
+    (for example pointing to local fake RPC endpoint in tests)
+    """
+
+    def __init__(self, timeout: float = 10.0):
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def call(self, rpc_url: str, contract: str, data: str) -> str:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        payload = {
+            "jsonrpc": "2.0",
+            "id": 1,
+            "method": "eth_call",
+            "params": [{"to": contract, "data": data}, "latest"],
+        }
+        async with self._session.post(rpc_url, json=payload) as response:
+            body = await response.json(content_type=None)
+        if "error" in body:
+            raise RuntimeError(f"RPC error from {rpc_url}: {body['error']}")
+        return body["result"]
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+class NFTResolver:
+    """
+    Resolves NFT metadata uri by type and id.
+    Base uri of every contract is fetched once (tokenURI(0)) and kept
+    in LRU cache, stale entries are refreshed in background.
+    """
+
+    def __init__(
+        self,
+        provider=None,
+        ttl: float = 600.0,
+        maxsize: int = 64,
+        contracts: Dict[int, Tuple[str, str]] = None,
+    ):
+        self.provider = provider or JsonRpcProvider()
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.contracts = dict(contracts or NFT_CONTRACTS)
+
+        # (rpc url, contract) -> (base uri, fetched at)
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[str, float]]" = OrderedDict()
+        self._in_flight: Dict[Tuple[str, str], asyncio.Future] = {}
+
+        self.rpc_calls = 0
+        self.hits = 0
+        self.misses = 0
+        # Called with seconds every RPC call took (metrics)
+        self.rpc_timer: Optional[Callable[[float], None]] = None
+
+    def set_provider(self, provider):
+        self.provider = provider
+        self._cache.clear()
+
+    def _contract_of(self, nft_type) -> Tuple[str, str]:
+        if nft_type == NFTType.bot:
+            return self.contracts[NFTType.bot]
+        return self.contracts[NFTType.shroom]
+
+    async def _fetch(self, key: Tuple[str, str]) -> str:
+        rpc_url, contract = key
+        self.rpc_calls += 1
+        data = TOKEN_URI_SELECTOR + "0" * 64
+        started = time.perf_counter()
+        try:
+            result = await self.provider.call(rpc_url, contract, data)
+        finally:
+            if self.rpc_timer is not None:
+                self.rpc_timer(time.perf_counter() - started)
+        # tokenURI(0) ends with "0" - cutting it to get base
+        base_uri = decode_abi_string(result)[:-1]
+
+        self._cache[key] = (base_uri, time.monotonic())
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+        return base_uri
+
+    async def _fetch_once(self, key: Tuple[str, str]) -> str:
+        # Concurrent misses of same contract share one RPC call
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(key))
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(future)
+
+    def _refresh_in_background(self, key: Tuple[str, str]):
+        if key in self._in_flight:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = loop.create_task(self._fetch_once(key))
+        task.add_done_callback(self._log_refresh_error)
+
+    @staticmethod
+    def _log_refresh_error(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logging.warning(f"NFT base uri refresh failed: {task.exception()}")
+
+    async def base_uri(self, nft_type) -> str:
+        key = self._contract_of(nft_type)
+        cached = self._cache.get(key)
+        if cached is None:
+            self.misses += 1
+            return await self._fetch_once(key)
+
+        self.hits += 1
+        self._cache.move_to_end(key)
+        base_uri, fetched = cached
+        if time.monotonic() - fetched > self.ttl:
+            # Serving stale value while refreshing
+            self._refresh_in_background(key)
+        return base_uri
+
+    async def prefetch(self, *nft_types):
+        """Warming cache for passed (or all known) NFT types"""
+        types = set(nft_types or self.contracts)
+        await asyncio.gather(
+            *(self.base_uri(nft_type) for nft_type in types),
+            return_exceptions=True,
+        )
+
+    async def uri(self, nft_type, nft_id) -> str:
+        return await self.base_uri(nft_type) + str(nft_id)
+
+    def cached_uri(self, nft_type, nft_id) -> Optional[str]:
+        """
+        Sync access for models - never does network call.
+        Returns None and schedules fetch if cache is cold.
+        """
+        key = self._contract_of(nft_type)
+        cached = self._cache.get(key)
+        if cached is None:
+            self.misses += 1
+            self._refresh_in_background(key)
+            return None
+
+        self.hits += 1
+        base_uri, fetched = cached
+        if time.monotonic() - fetched > self.ttl:
+            self._refresh_in_background(key)
+        return base_uri + str(nft_id)
+
+    async def run_refresh(self, interval: float = None):
+        """Background task refreshing all cached base uris"""
+        interval = interval or self.ttl / 2
+        while True:
+            await asyncio.sleep(interval)
+            for key in list(self._cache):
+                try:
+                    await self._fetch_once(key)
+                except Exception as ex:
+                    logging.warning(f"NFT base uri refresh of {key} failed: {ex}")
+
+
+nft_resolver = NFTResolver()
@@ -0,0 +1,29 @@
+from typing import List, Optional, Tuple
+
+# Page size when client streams without limit, and max page size
+PAGE_LIMIT = 100
+PAGE_LIMIT_MAX = 500
+
+
+def keyset_page(
+    encoder, query, id_column, cursor=None, limit=None, order: str = "asc"
+) -> Tuple[List[dict], Optional[int]]:
+    """
+    Page of rows after `cursor` (id of the last row client has).
+    Rows are picked by id range - cost does not grow with page number,
+    indexes on filtered columns end with rowid, so no sort is needed.
+    Returns encoded rows and cursor of the next page (None - last page).
+    """
+    if cursor is not None:
+        query = query.filter(
+            id_column < cursor if order == "desc" else id_column > cursor
+        )
+    query = query.order_by(id_column.desc() if order == "desc" else id_column.asc())
+    if limit is None:
+        return encoder.all(query), None
+
+    rows = encoder.all(query.limit(limit + 1))
+    if len(rows) <= limit:
+        return rows, None
+    rows.pop()
+    return rows, rows[-1]["id"]
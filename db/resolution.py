@@ -0,0 +1,54 @@
+from typing import Optional
+
+from .move import Choice
+
+try:
+    import numpy as np  # type: ignore
+except ImportError:  # batched API is optional
+    np = None
+
+# Choice -> choice it beats
+BEATS = {
+    Choice.attack: Choice.trick,
+    Choice.trick: Choice.block,
+    Choice.block: Choice.attack,
+}
+
+# OUTCOMES[first][second]: 1 - first wins, -1 - second wins, 0 - draw
+# (row and column 0 are unused, choices start from 1)
+OUTCOMES = tuple(
+    tuple(
+        0 if a == b or 0 in (a, b) else 1 if BEATS[Choice(a)] == b else -1
+        for b in range(len(Choice) + 1)
+    )
+    for a in range(len(Choice) + 1)
+)
+
+
+def resolve(first_choice, second_choice) -> int:
+    return OUTCOMES[first_choice][second_choice]
+
+
+def round_winner(first_move, second_move) -> Optional[str]:
+    """Address of move owner who won the round ("no_one" on draw)"""
+    outcome = OUTCOMES[first_move.choice][second_move.choice]
+    if outcome == 0:
+        return "no_one"
+    return first_move.owner_address if outcome > 0 else second_move.owner_address
+
+
+def resolve_many(first_choices, second_choices):
+    """Outcomes of many rounds at once (arrays of choices -> int8 array)"""
+    if np is None:
+        raise RuntimeError("Install 'numpy' package to resolve rounds in batches")
+    return _outcome_matrix()[np.asarray(first_choices), np.asarray(second_choices)]
+
+
+_matrix = None
+
+
+def _outcome_matrix():
+    global _matrix
+    if _matrix is None:
+        _matrix = np.array(OUTCOMES, dtype=np.int8)
+    return _matrix
@@ -1,7 +1,7 @@
 import sqlalchemy as sa  # type: ignore
 from sqlalchemy import orm
 from sqlalchemy.ext.hybrid import hybrid_method  # type: ignore
-from .move import Choice
+from .resolution import round_winner
 
 
 from .database import SqlAlchemyBase
@@ -19,7 +19,7 @@ class Round(SqlAlchemyBase):
 
     winner_sid = sa.Column(sa.String, nullable=True, default=None)
 
-    battle_id = sa.Column(sa.Integer, sa.ForeignKey("battles.id"))
+    battle_id = sa.Column(sa.Integer, sa.ForeignKey("battles.id"), index=True)
     battle = orm.relationship("Battle")
 
     moves = orm.relationship("Move", back_populates="round")
@@ -32,28 +32,6 @@ class Round(SqlAlchemyBase):
         raise ValueError("not found move with such address")
 
     @hybrid_method
-    def set_winner_user_address(self):  # noqa
+    def set_winner_user_address(self):
         if len(self.moves) == 2:
-            # Player2 is a player who made last move so his sid is in "sid" var
-            player1 = self.moves[0]  # != sid
-            player2 = self.moves[1]  # sid
-
-            # Game logic
-            if player1.choice == player2.choice:
-                self.winner_user_address = "no_one"
-            else:
-                if player1.choice == Choice.attack:
-                    if player2.choice == Choice.trick:
-                        self.winner_user_address = player1.owner_address
-                    else:
-                        self.winner_user_address = player2.owner_address
-                elif player1.choice == Choice.trick:
-                    if player2.choice == Choice.block:
-                        self.winner_user_address = player1.owner_address
-                    else:
-                        self.winner_user_address = player2.owner_address
-                elif player1.choice == Choice.block:
-                    if player2.choice == Choice.attack:
-                        self.winner_user_address = player1.owner_address
-                    else:
-                        self.winner_user_address = player2.owner_address
+            self.winner_user_address = round_winner(self.moves[0], self.moves[1])
@@ -0,0 +1,60 @@
+from typing import List, Optional
+
+from .accept import Accept
+from .battle import Battle
+from .nft_resolver import nft_resolver
+from .round import Round
+
+
+class RowEncoder:
+    """
+    Row -> dict encoder of model columns (same fields as pydantic models).
+    Columns are selected directly, so no ORM objects are built,
+    enum values are sent as ints.
+    """
+
+    def __init__(self, model, uri: bool = False):
+        table_columns = list(model.__table__.columns)
+        self.fields = tuple(column.key for column in table_columns)
+        self.columns = [getattr(model, field) for field in self.fields]
+        # (index, converter) of columns which values are not JSON types
+        self._converters = [
+            (index, int)
+            for index, column in enumerate(table_columns)
+            if getattr(column.type, "enum_class", None) is not None
+        ]
+        self.uri = uri
+        if uri:
+            self._nft_type = self.fields.index("nft_type")
+            self._nft_id = self.fields.index("nft_id")
+
+    def query(self, db_sess):
+        return db_sess.query(*self.columns)
+
+    def encode_row(self, row) -> dict:
+        values = list(row)
+        for index, convert in self._converters:
+            if values[index] is not None:
+                values[index] = convert(values[index])
+        encoded = dict(zip(self.fields, values))
+        if self.uri:
+            # Base uri is cached by resolver - no RPC call per row
+            encoded["uri"] = nft_resolver.cached_uri(
+                values[self._nft_type], values[self._nft_id]
+            )
+        return encoded
+
+    def all(self, query) -> List[dict]:
+        encode_row = self.encode_row
+        return [encode_row(row) for row in query]
+
+    def encode_object(self, obj) -> Optional[dict]:
+        """Encoding already loaded ORM object"""
+        if obj is None:
+            return None
+        return self.encode_row([getattr(obj, field) for field in self.fields])
+
+
+battle_encoder = RowEncoder(Battle, uri=True)
+accept_encoder = RowEncoder(Accept)
+round_encoder = RowEncoder(Round)
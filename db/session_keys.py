@@ -11,4 +11,31 @@ class SessionKey(SqlAlchemyBase):
     user_address = sa.Column(sa.String)
 
     verified = sa.Column(sa.Boolean, default=False)
-    created = sa.Column(sa.DateTime, default=datetime.datetime.utcnow)
+    created = sa.Column(sa.DateTime, default=datetime.datetime.utcnow, index=True)
+
+
+def save_verified_session_key(db_sess, session_key, user_address):
+    db_sess.merge(
+        SessionKey(session_key=session_key, user_address=user_address, verified=True)
+    )
+
+
+def load_session_address(db_sess, session_key, ttl: float):
+    """Address of verified not expired session key (None if there is no such)"""
+    created_after = datetime.datetime.utcnow() - datetime.timedelta(seconds=ttl)
+    return (
+        db_sess.query(SessionKey.user_address)
+        .filter(SessionKey.session_key == session_key)
+        .filter(SessionKey.verified.is_(True))
+        .filter(SessionKey.created > created_after)
+        .scalar()
+    )
+
+
+def delete_expired_session_keys(db_sess, ttl: float) -> int:
+    created_before = datetime.datetime.utcnow() - datetime.timedelta(seconds=ttl)
+    return (
+        db_sess.query(SessionKey)
+        .filter(SessionKey.created <= created_before)
+        .delete(synchronize_session=False)
+    )
@@ -1,11 +1,14 @@
+import asyncio
 import logging
+import math
+import os
+import signal
 import time
-import asyncio
 import socketio  # type: ignore
-from sanic import Sanic
+from sanic import Sanic, response
+from sanic.worker.loader import AppLoader
 import json
-from dataclasses import dataclass
-from eth_account.messages import encode_defunct
+from web3 import Web3
 
 # Randomness modules
 import uuid
@@ -14,6 +17,24 @@ import random
 # Database modules
 from db import *  # noqa
 
+from services.auth import SignatureVerifier
+from db.pagination import PAGE_LIMIT, PAGE_LIMIT_MAX, keyset_page
+from db.resolution import resolve
+from db.serializers import accept_encoder, battle_encoder, round_encoder
+from services import codecs
+from services.battles import AcceptRegistry, BattleRegistry, LiveBattle
+from services.cluster import make_client_manager, make_cluster
+from services.diagnostics import LoopMonitor, SamplingProfiler
+from services.matchmaking import MatchQueue
+from services.connections import ConnectionRegistry
+from services.metrics import Metrics
+from services.persistence import WriteBehindQueue
+from services.query_cache import QueryCache
+from services.ratelimit import RateLimiter, parse_budgets
+from services.recommendations import RecommendationPool
+from services.scheduler import TimerWheel
+from services.sessions import SessionCache
+
 
 def check_passed_data(dic: dict, *names):
     """
@@ -27,6 +48,13 @@ def check_passed_data(dic: dict, *names):
     return True
 
 
+def is_valid_bet(bet) -> bool:
+    try:
+        return math.isfinite(float(bet))
+    except (TypeError, ValueError):
+        return False
+
+
 # Client states possible
 class ClientState(Enum):  # noqa
     logging_in = 1
@@ -34,36 +62,250 @@ class ClientState(Enum):  # noqa
     in_battle = 3
 
 
-# Client connection data
+# Client connection data (sid <-> address indexed)
 # TODO: change to sio.save_session
-clients = {}  # type: ignore
+clients = ConnectionRegistry()
 
 
-@dataclass
 class Client:
-    sid: str
-    session_key: str
-    address: str = ""
-    state: ClientState = ClientState.logging_in  # type: ignore
-    current_battle: int = -1
-
+    __slots__ = ("sid", "session_key", "address", "state", "current_battle", "codec")
+
+    def __init__(
+        self,
+        sid: str,
+        session_key: str,
+        address: str = "",
+        state: int = ClientState.logging_in,  # type: ignore
+        current_battle: int = -1,
+    ):
+        self.sid = sid
+        self.session_key = session_key
+        self.address = address
+        self.state = state
+        self.current_battle = current_battle
+        # Encoding of list responses (negotiated by client)
+        self.codec = codecs.DEFAULT_CODEC
+
+    def __repr__(self) -> str:
+        return f"Client({self.sid!r}, {self.address!r}, state={self.state})"
+
+    @staticmethod
     def get_sid_by_address(address) -> str:
-        global clients
         if address == "no_one":
             return "no_one"
-        for sid in clients:
-            if clients[sid].address == address:
-                return sid
+        return clients.get_sid_by_address(address)
+
+
+def encode_response(sid, value):
+    return codecs.encode(clients[sid].codec, value)
+
+
+def get_participant_sid(battle_info, address) -> str:
+    """
+    Sid which joined the battle with address - it may be already
+    disconnected or connected to another worker
+    """
+    if address == battle_info.creator.address:
+        return battle_info.creator.sid
+    if address == battle_info.acceptor.address:
+        return battle_info.acceptor.sid
+    return "no_one"
+
+
+def get_round_winner(battle_info, creator_choice, acceptor_choice):
+    """Client who won the round (None on draw)"""
+    outcome = resolve(creator_choice, acceptor_choice)
+    if outcome == 0:
+        return None
+    return battle_info.creator if outcome > 0 else battle_info.acceptor
+
+
+async def find_sid(address) -> str:
+    """Sid of address connected to this or (in cluster mode) any worker"""
+    try:
+        return Client.get_sid_by_address(address)
+    except ValueError:
+        if cluster is None:
+            raise
+    record = await cluster.store.get("client", address)
+    if record is None:
         raise ValueError(f"Not found client with address {address}")
+    return record["sid"]
+
 
+async def get_accept_creator(accept_id):
+    if accept_id in accepts:
+        return accepts[accept_id]
+    if cluster is None:
+        return None
+    # Accept was made by client of another worker
+    record = await cluster.store.get("accept", accept_id)
+    if record is None:
+        return None
+    return Client(record["sid"], "", record["address"], ClientState.in_menu)
+
+
+async def forget_client(client: Client):
+    record = await cluster.store.get("client", client.address)
+    if record is not None and record["sid"] == client.sid:
+        await cluster.store.delete("client", client.address)
+
+
+def applicants_room(battle_id) -> str:
+    # Everyone who accepted listed battle
+    return f"battle:{battle_id}:applicants"
+
+
+def participants_room(battle_id) -> str:
+    # Both players of live battle
+    return f"battle:{battle_id}:participants"
+
+
+def spectators_room(battle_id) -> str:
+    # Clients watching live battle
+    return f"battle:{battle_id}:spectators"
+
+
+async def join_battle_room(client: Client):
+    if client.current_battle != -1 and client.sid in clients:
+        await sio.enter_room(client.sid, participants_room(client.current_battle))
+
+
+async def cancel_applicants(battle_id, skip_sid=None):
+    """One broadcast to all applicants of battle instead of emit per accept"""
+    room = applicants_room(battle_id)
+    await sio.emit(
+        "battle_canceled", {"battle_id": battle_id}, room=room, skip_sid=skip_sid
+    )
+    await sio.close_room(room)
+
+
+async def update_client(client: Client, state, current_battle: int):
+    client.state = state
+    client.current_battle = current_battle
+    if client.sid in clients:
+        await join_battle_room(client)
+        return
+    if cluster is None:
+        return
+    # Client is connected to another worker - its copy must be updated there
+    record = await cluster.store.get("client", client.address)
+    if record is not None and record["sid"] == client.sid:
+        await cluster.send(
+            record["worker"],
+            "client_update",
+            sid=client.sid,
+            state=state,
+            current_battle=current_battle,
+        )
 
-# Memory battlers sids
-# BATTLES: 'creator', 'log', 'state'
-battles = {}  # type: ignore
-accepts = {}
 
-database.global_init_sqlite("db.sqlite")  # type: ignore # noqa
-sio = socketio.AsyncServer(async_mode="sanic", cors_allowed_origins="*")
+# Memory battles (indexed by creator and state) and accepts (by battle)
+battles = BattleRegistry()
+accepts = AcceptRegistry()
+# Players waiting for automatic opponent (bet tier upper bounds from env).
+# Queue is per worker - in cluster mode players of one worker are paired
+matchmaking = MatchQueue(
+    [
+        float(bet)
+        for bet in os.environ.get("MATCH_BET_TIERS", "1,10,100,1000").split(",")
+    ]
+)
+# Listed battles to recommend (sampled without DB)
+recommendations = RecommendationPool()
+RECOMMENDED_COUNT = 3
+
+# Seconds player has to make a move before it is done randomly
+ROUND_TIMEOUT = float(os.environ.get("ROUND_TIMEOUT", "10"))
+# Per-battle round deadlines (keyed by battle id)
+round_timers = TimerWheel()
+# Ended rounds and battles waiting to be written to DB
+# (failed batches are retried, ids of battles dropped after that are logged)
+battle_log_writer = WriteBehindQueue(
+    lambda items: flush_battle_log(items), item_key=lambda item: item["battle_id"]
+)
+
+# Multi-worker mode: "redis://..." (or "memory://..." in one process)
+CLUSTER_URL = os.environ.get("CLUSTER_URL")
+cluster = make_cluster(CLUSTER_URL)
+# Seconds shared accept record outlives its worker (normally deleted earlier)
+ACCEPT_TTL = float(os.environ.get("ACCEPT_TTL", "86400"))
+
+# Reaper evicts ended battles after ENDED_BATTLE_TTL seconds and ends
+# battles nobody moved in for IDLE_BATTLE_TTL seconds
+REAP_INTERVAL = float(os.environ.get("REAP_INTERVAL", "60"))
+ENDED_BATTLE_TTL = float(os.environ.get("ENDED_BATTLE_TTL", "300"))
+IDLE_BATTLE_TTL = float(os.environ.get("IDLE_BATTLE_TTL", "900"))
+reaper_stats = {
+    "evicted_battles": 0,
+    "evicted_accepts": 0,
+    "abandoned_battles": 0,
+    "leaked_accepts": 0,
+}
+
+# Verified session keys, reconnected client resumes them without signing
+SESSION_TTL = float(os.environ.get("SESSION_TTL", "86400"))
+sessions = SessionCache(SESSION_TTL)
+
+# Lobby lists cached by owner address / battle id (rows in all entries).
+# Disabled in cluster mode - other workers write the same tables
+QUERY_CACHE_ROWS = int(os.environ.get("QUERY_CACHE_ROWS", "100000"))
+query_cache = QueryCache(QUERY_CACHE_ROWS if cluster is None else 0)
+
+# Signatures are recovered in process pool (AUTH_WORKERS=0 - in loop thread)
+signature_verifier = SignatureVerifier(
+    int(os.environ["AUTH_WORKERS"]) if "AUTH_WORKERS" in os.environ else None
+)
+
+DB_FILE = os.environ.get("DB_FILE", "db.sqlite")
+database.global_init_sqlite(DB_FILE)  # type: ignore # noqa
+
+# Handlers, DB and RPC stats exported on /metrics
+metrics = Metrics()
+database.set_session_timer(metrics.observe_db)  # noqa
+nft_resolver.rpc_timer = metrics.observe_rpc  # noqa
+
+# Loop lag, blocked loop stacks (STALL_THRESHOLD seconds without heartbeat)
+# and handlers running over SLOW_HANDLER_THRESHOLD seconds
+loop_monitor = LoopMonitor(
+    metrics,
+    stall_threshold=float(os.environ.get("STALL_THRESHOLD", "0.1")),
+    slow_threshold=float(os.environ.get("SLOW_HANDLER_THRESHOLD", "1")),
+)
+# Sampling profiler started by admin event or SIGUSR1, writes PROFILE_DIR
+profiler = SamplingProfiler(os.environ.get("PROFILE_DIR", "profiles"))
+PROFILE_SECONDS = float(os.environ.get("PROFILE_SECONDS", "30"))
+# Per client budgets "event=tokens per second/burst" (default - other events)
+# and global limit of expensive (DB + RPC heavy) handlers running at once
+RATE_LIMITS = os.environ.get(
+    "RATE_LIMITS",
+    "get_battles_list=5/10,get_recommended_battles=5/10,accepts_list=5/10,"
+    "get_battle_log=2/5,verify_signature=1/3,resume_session=1/3,"
+    "enqueue_match=2/5,default=20/40",
+)
+rate_limiter = RateLimiter(
+    parse_budgets(RATE_LIMITS),
+    expensive=(
+        "get_battles_list",
+        "get_recommended_battles",
+        "accepts_list",
+        "get_battle_log",
+        "spectate_battle",
+    ),
+    max_in_flight=int(os.environ.get("MAX_IN_FLIGHT", "64")),
+)
+
+# Comma separated addresses allowed to send admin events
+ADMIN_ADDRESSES = {
+    Web3.toChecksumAddress(address.strip())
+    for address in os.environ.get("ADMIN_ADDRESSES", "").split(",")
+    if address.strip()
+}
+sio = socketio.AsyncServer(
+    async_mode="sanic",
+    cors_allowed_origins="*",
+    client_manager=make_client_manager(CLUSTER_URL),
+)
 
 # Connect and disconnect handlers
 
@@ -72,42 +314,125 @@ sio = socketio.AsyncServer(async_mode="sanic", cors_allowed_origins="*")
 async def connect(sid, environ):
     logging.info(f"Client {sid} connected")
     session_key = str(uuid.uuid4())
-    clients[sid] = Client(sid, session_key)
+    clients.add(sid, Client(sid, session_key))
     await sio.emit("session_key", {"session_key": str(session_key)}, room=sid)
 
 
+def query_accept_ids(db_sess, battle_ids) -> list:
+    return [
+        accept_id
+        for accept_id, in db_sess.query(Accept.id).filter(  # noqa
+            Accept.battle_id.in_(battle_ids)  # noqa
+        )
+    ]
+
+
+def delete_battles(db_sess, battle_ids):
+    """Deleting battles with their accepts, returns ids of deleted accepts"""
+    accept_ids = query_accept_ids(db_sess, battle_ids)
+    # Bulk deletes skip ORM cascade, so accepts are deleted explicitly
+    db_sess.query(Accept).filter(Accept.battle_id.in_(battle_ids)).delete(  # noqa
+        synchronize_session=False
+    )
+    db_sess.query(Battle).filter(Battle.id.in_(battle_ids)).delete(  # noqa
+        synchronize_session=False
+    )
+    return accept_ids
+
+
+def delete_accept(db_sess, accept_id):
+    db_sess.query(Accept).filter(Accept.id == accept_id).delete(  # noqa
+        synchronize_session=False
+    )
+
+
+async def forget_accepts(accept_ids):
+    """Dropping shared records of accepts which can't be started anymore"""
+    if cluster is None:
+        return
+    for accept_id in accept_ids:
+        await cluster.store.delete("accept", accept_id)
+
+
+def save_battle_log(db_sess, items):
+    ended_ids = []
+    for item in items:
+        if item["kind"] == "ended":
+            ended_ids.append(item["battle_id"])
+            continue
+        round_db = Round(  # noqa
+            battle_id=item["battle_id"],
+            round_number=item["round_number"],
+            winner_user_address=item["winner_user_address"],
+            winner_sid=item["winner_sid"],
+        )
+        for owner_address, choice in item["moves"]:
+            move_db = Move(owner_address=owner_address, choice=choice)  # noqa
+            round_db.moves.append(move_db)
+        db_sess.add(round_db)
+
+    if ended_ids:
+        db_sess.query(Battle).filter(Battle.id.in_(ended_ids)).update(  # noqa
+            {Battle.battle_state: BattleState.ended},  # noqa
+            synchronize_session=False,
+        )
+
+
+async def flush_battle_log(items):
+    # One transaction per batch instead of commit per move
+    await database.run_in_session(save_battle_log, items)  # noqa
+    # After commit, so readers don't cache rows of the previous state
+    for item in items:
+        if item["kind"] == "ended":
+            query_cache.invalidate(("battles", item["owner_address"]))
+
+
+def forget_creator_battles(sid) -> list:
+    """Dropping listed and ended battles of sid, returns ids to delete in DB"""
+    to_delete_db = []
+    # Only battles created by this client are visited
+    for battle_id in battles.of_creator_sid(sid):
+        state = battles[battle_id].state
+        if state == BattleState.listed:  # noqa
+            to_delete_db.append(battle_id)
+            battles.remove(battle_id)
+            accepts.remove_battle(battle_id)
+            recommendations.remove(battle_id)
+        elif state == BattleState.ended:  # noqa
+            battles.remove(battle_id)
+            accepts.remove_battle(battle_id)
+    return to_delete_db
+
+
+async def delete_listed_battles(owner_address, battle_ids):
+    accept_ids = await database.run_in_session(delete_battles, battle_ids)  # noqa
+    await forget_accepts(accept_ids)
+    query_cache.invalidate(("battles", owner_address))
+    for battle_id in battle_ids:
+        query_cache.invalidate(("accepts", battle_id))
+        await cancel_applicants(battle_id)
+
+
 @sio.event
 async def disconnect(sid):
     logging.info(f"Client {sid} disconnected")
 
-    db_sess = database.create_session()  # noqa
-    to_delete_ind = []
     try:
-        lock = asyncio.Lock()
-        async with lock:
-            del clients[sid]
-            for battle_id in battles:
-                battle_info = battles[battle_id]
-                if (
-                    battle_info["creator"].sid == sid
-                    and battle_info["state"] == BattleState.listed  # noqa
-                ):  # noqa
-                    battle_db = (
-                        db_sess.query(Battle)  # noqa
-                        .filter(Battle.id == battle_id)  # noqa
-                        .first()
-                    )  # noqa
-                    db_sess.delete(battle_db)
-                    db_sess.commit()
-                    to_delete_ind.append(battle_id)
-
-                if (
-                    battle_info["creator"].sid == sid
-                    and battle_info["state"] == BattleState.ended  # noqa
-                ):  # noqa
-                    to_delete_ind.append(battle_id)
-            for battle_id in to_delete_ind:
-                del battles[battle_id]
+        async with battles.lock:
+            if sid not in clients:
+                # Session was resumed by another socket
+                return
+            client = clients.remove(sid)
+            to_delete_db = forget_creator_battles(sid)
+            matchmaking.remove(sid)
+            rate_limiter.forget(sid)
+            if client.address and not clients.sids_of(client.address):
+                rate_limiter.forget(client.address)
+
+        if to_delete_db:
+            await delete_listed_battles(client.address, to_delete_db)
+        if cluster is not None:
+            await forget_client(client)
     except BaseException as be:
         logging.warning(f"{be} coused after {sid} disconnected")
 
@@ -117,18 +442,27 @@ async def disconnect(sid):
 async def verify_signature(sid, data):
     logging.info(f"Client {sid} verifying signature")
     try:
-        w3 = Web3()  # noqa
-        clients[sid].address = Web3.toChecksumAddress(data["address"])  # noqa
-        account_recovered = w3.eth.account.recover_message(
-            encode_defunct(text=clients[sid].session_key),
-            signature=str(data["signature"]),
+        address = Web3.toChecksumAddress(data["address"])  # noqa
+        account_recovered = await signature_verifier.recover(
+            clients[sid].session_key, str(data["signature"])
         )
     except Exception as ex:
         return "verification_error", str(ex)
 
-    if clients[sid].address == account_recovered:
-        clients[sid].state = ClientState.in_menu
-        return "verification_completed", clients[sid].session_key
+    if address == account_recovered:
+        # Address is indexed only after it is verified
+        client = clients[sid]
+        clients.bind_address(sid, address)
+        client.state = ClientState.in_menu
+        sessions.remember(client.session_key, address, client)
+        await database.run_in_session(  # noqa
+            save_verified_session_key, client.session_key, address  # noqa
+        )
+        if cluster is not None:
+            await cluster.store.set(
+                "client", address, {"sid": sid, "worker": cluster.worker_id}
+            )
+        return "verification_completed", client.session_key
     else:
         return (
             "verification_error",
@@ -136,6 +470,191 @@ async def verify_signature(sid, data):
         )
 
 
+async def rebind_client(client: Client, sid: str):
+    """Moving resumed client (with its state and battles) to new sid"""
+    old_sid = client.sid
+    # Old socket may be still open (server didn't notice it is dead)
+    still_open = old_sid != sid and old_sid in clients
+    async with battles.lock:
+        if still_open:
+            clients.remove(old_sid)
+        client.sid = sid
+        battles.rebind_creator_sid(old_sid, sid)
+        # disconnect of old sid returns early, its buckets are dropped here
+        rate_limiter.forget(old_sid)
+    if still_open:
+        await sio.disconnect(old_sid)
+
+
+# Resuming verified session on reconnect
+@sio.event
+async def resume_session(sid, data):
+    logging.info(f"Client {sid} resuming session")
+    if not check_passed_data(data, "session_key"):
+        return ("wrong_input", "You need to pass 'session_key'")
+
+    session_key = str(data["session_key"])
+    session = sessions.get(session_key)
+    if session is None:
+        address = await database.run_in_session(  # noqa
+            load_session_address, session_key, SESSION_TTL, read_only=True  # noqa
+        )
+        if address is None:
+            return ("session_error", "Session expired or not verified")
+        session = sessions.remember(session_key, address)
+
+    # Replacing client made on connect
+    clients.remove(sid)
+    if session.client is None:
+        # Session known only from DB (restart or another worker)
+        session.client = Client(sid, session_key, session.address, ClientState.in_menu)
+    else:
+        await rebind_client(session.client, sid)
+    client = session.client
+    clients.add(sid, client)
+    await join_battle_room(client)
+
+    if cluster is not None:
+        await cluster.store.set(
+            "client", client.address, {"sid": sid, "worker": cluster.worker_id}
+        )
+    return "session_resumed", json.dumps(
+        {
+            "address": client.address,
+            "state": client.state,
+            "current_battle": client.current_battle,
+        }
+    )
+
+
+async def expire_sessions():
+    """Task dropping expired session keys from cache and DB"""
+    while True:
+        await asyncio.sleep(min(SESSION_TTL, 3600))
+        sessions.expire()
+        try:
+            await database.run_in_session(  # noqa
+                delete_expired_session_keys, SESSION_TTL  # noqa
+            )
+        except Exception:
+            logging.error("Expiring session keys failed", exc_info=True)
+
+
+# Choosing encoding of list responses ("json", "native" or "msgpack")
+@sio.event
+async def negotiate_codec(sid, data):
+    if not check_passed_data(data, "codecs"):
+        return ("wrong_input", "You need to pass 'codecs' (preferred first)")
+    clients[sid].codec = codecs.negotiate(data["codecs"])
+    return ("codec_selected", clients[sid].codec)
+
+
+def get_page_params(data: dict) -> dict:
+    """
+    List params: cursor (id of last row got), limit, order ("asc"/"desc"),
+    state filter and stream (pages are emitted as events).
+    Without limit and stream whole list is returned as before.
+    """
+    state = data.get("state")
+    params = {
+        "cursor": None if data.get("cursor") is None else int(data["cursor"]),
+        "limit": None if data.get("limit") is None else int(data["limit"]),
+        "order": data.get("order", "asc"),
+        "state": None if state is None else BattleState(state),  # noqa
+        "stream": bool(data.get("stream", False)),
+    }
+    if params["order"] not in ("asc", "desc"):
+        raise ValueError("Unknown order")
+    if params["limit"] is None and params["stream"]:
+        params["limit"] = PAGE_LIMIT
+    if params["limit"] is not None:
+        params["limit"] = max(1, min(params["limit"], PAGE_LIMIT_MAX))
+    return params
+
+
+async def stream_pages(sid, event, release, query_page, params, *args):
+    """
+    Emitting pages one by one, so first one is shown before the rest is read.
+    release() frees in-flight slot of the handler which started streaming
+    """
+    cursor = params["cursor"]
+    try:
+        while True:
+            items, cursor = await database.run_in_session(  # noqa
+                query_page, cursor, *args, read_only=True
+            )
+            # Client may disconnect while page is read
+            if sid not in clients:
+                return
+            await sio.emit(
+                event,
+                encode_response(sid, {"items": items, "next_cursor": cursor}),
+                room=sid,
+            )
+            if cursor is None:
+                return
+    finally:
+        release()
+
+
+async def cached_page(tag, query_page, params, *args):
+    key = (tag, params["cursor"], params["limit"], params["order"], params["state"])
+    page = query_cache.get(key)
+    if page is not None:
+        return page
+
+    generation = query_cache.generation(tag)
+    page = await database.run_in_session(  # noqa
+        query_page, params["cursor"], *args, read_only=True
+    )
+    # Rows with not resolved NFT uri would stay without it till invalidation
+    if all(item.get("uri", "") is not None for item in page[0]):
+        query_cache.put(key, tag, generation, page, weight=max(len(page[0]), 1))
+    return page
+
+
+async def respond_list(sid, event, tag, query_page, params, *args):
+    """
+    query_page(db_sess, cursor, *args) returns rows and cursor of the next page,
+    pages are cached under tag (invalidated by handlers changing the rows)
+    """
+    if params["stream"]:
+        # Streamed queries keep in-flight slot till the last page
+        release = rate_limiter.detach_slot()
+        sio.start_background_task(
+            stream_pages, sid, event, release, query_page, params, *args
+        )
+        return ("streaming", event)
+
+    items, next_cursor = await cached_page(tag, query_page, params, *args)
+    if params["limit"] is None:
+        return encode_response(sid, items)
+    return encode_response(sid, {"items": items, "next_cursor": next_cursor})
+
+
+PAGE_PARAMS_ERROR = (
+    "wrong_input",
+    "'battle_id', 'cursor', 'limit' and 'state' must be numbers, "
+    "'order' - 'asc' or 'desc'",
+)
+
+
+def query_battles_page(db_sess, cursor, address, params):
+    query = battle_encoder.query(db_sess).filter(
+        Battle.owner_address == address  # noqa
+    )
+    if params["state"] is not None:
+        query = query.filter(Battle.battle_state == params["state"])  # noqa
+    return keyset_page(
+        battle_encoder,
+        query,
+        Battle.id,  # noqa
+        cursor,
+        params["limit"],
+        params["order"],
+    )
+
+
 # Getting list of all battles
 @sio.event
 async def get_battles_list(sid, data):
@@ -145,28 +664,29 @@ async def get_battles_list(sid, data):
         return ("authentication_error", "You need to log in first")
 
     try:
-        db_sess = database.create_session()  # noqa
         if "address" in data.keys():
             address = Web3.toChecksumAddress(data["address"])  # noqa
             logging.debug(f"Client {sid} getting battles of {address}")
-            battles = (
-                db_sess.query(Battle)  # noqa
-                .filter(Battle.owner_address == address)  # noqa
-                .all()
-            )  # noqa
         else:
             logging.debug(f"Client {sid} not passed address to get_battles_list")
             return ("wrong_input", "Address of user not passed")
 
-        dict_battles = []
-        for battle in battles:
-            pydantic_battle = PydanticBattle.from_orm(battle)  # noqa
-            dict_battle = pydantic_battle.dict()
-            dict_battle["uri"] = battle.uri
-            dict_battles.append(dict_battle)
-
-        logging.debug(f"Client {sid} getting battles: {dict_battles}")
-        return json.dumps(dict_battles)
+        try:
+            params = get_page_params(data)
+        except (TypeError, ValueError):
+            return PAGE_PARAMS_ERROR
+
+        # Warming cached NFT base uris before serialising rows
+        await nft_resolver.prefetch()  # noqa
+        return await respond_list(
+            sid,
+            "battles_list_page",
+            ("battles", address),
+            query_battles_page,
+            params,
+            address,
+            params,
+        )
     except Exception as e:  # noqa
         logging.error("Error in get_battles_list:", exc_info=True)
 
@@ -179,65 +699,101 @@ async def create_battle_offer(sid, data):
 
     if not check_passed_data(data, "nft_type", "nft_id", "bet"):
         return ("wrong_input", "You need to pass 'bet', 'nft_type' and 'nft_id'")
+    if not is_valid_bet(data["bet"]):
+        return ("wrong_input", "'bet' must be a finite number")
 
-    db_sess = database.create_session()  # noqa
-
+    client = clients[sid]
     battle = Battle()  # noqa
-    battle.owner_address = clients[sid].address
+    battle.owner_address = client.address
     battle.nft_id = data["nft_id"]
     battle.nft_type = data["nft_type"]
     battle.bet = data["bet"]
     battle.battle_state = BattleState.listed  # noqa
 
-    db_sess.add(battle)
-    db_sess.commit()
+    def add_battle(db_sess):
+        db_sess.add(battle)
+        db_sess.flush()
+        return battle
+
+    battle = await database.run_in_session(add_battle)  # noqa
+    query_cache.invalidate(("battles", battle.owner_address))
+
+    if client.sid not in clients:
+        # Disconnected while battle was saved - disconnect didn't see it
+        await database.run_in_session(delete_battles, [battle.id])  # noqa
+        query_cache.invalidate(("battles", battle.owner_address))
+        return ("error", "Client disconnected")
 
     # Saving creator of the battle ( access by battle_id)
-    battles[battle.id] = {
-        "creator": clients[sid],
-        "log": [],
-        "state": BattleState.listed,  # noqa
-    }  # noqa
+    battles.add(battle.id, LiveBattle(client, BattleState.listed))  # noqa
 
     pydantic_battle = PydanticBattle.from_orm(battle)  # noqa
+    recommendations.add(battle_encoder.encode_object(battle))
     dict_battle = pydantic_battle.dict(exclude={"owner_address"})
 
     # Adding hybrid property to response dict - uri
+    await nft_resolver.prefetch(battle.nft_type)  # noqa
     dict_battle["uri"] = battle.uri
 
     return json.dumps(dict_battle)
 
 
+def get_recommendation_filters(data: dict) -> dict:
+    filters = {}
+    if "nft_type" in data:
+        filters["nft_type"] = int(data["nft_type"])
+    for name in ("min_bet", "max_bet"):
+        if name in data:
+            filters[name] = float(data[name])
+    return filters
+
+
 @sio.event
-async def get_recommended_battles(sid):
+async def get_recommended_battles(sid, data=None):
     logging.info(f"Client {sid} getting recommended battles")
     if clients[sid].state == ClientState.logging_in:
         logging.info(f"Client {sid} CONNECTION REFUSED (AUTH)")
         return ("authentication_error", "You need to log in first")
 
     try:
-        db_sess = database.create_session()  # noqa
+        filters = get_recommendation_filters(data or {})
+    except (TypeError, ValueError):
+        return ("wrong_input", "'nft_type', 'min_bet' and 'max_bet' must be numbers")
 
-        all_offers = (
-            db_sess.query(Battle)  # noqa
-            .filter(Battle.owner_address != clients[sid].address)  # noqa
-            .filter(Battle.battle_state == BattleState.listed)  # noqa
-            .all()
-        )  # noqa
-        if len(all_offers) >= 3:
-            recommended_battles = random.sample(all_offers, k=3)
+    try:
+        address = clients[sid].address
+        if cluster is None:
+            # Pool has every battle listed in this process - no DB work
+            recommended_battles = recommendations.sample(
+                RECOMMENDED_COUNT, address, **filters
+            )
         else:
-            recommended_battles = all_offers
+            # Battles listed on other workers are only in DB
+            battles_db = await database.run_in_session(  # noqa
+                sample_listed_battles,  # noqa
+                RECOMMENDED_COUNT,
+                address,
+                read_only=True,
+                **filters,
+            )
+            recommended_battles = [
+                battle_encoder.encode_object(battle) for battle in battles_db
+            ]
+
+        await nft_resolver.prefetch(  # noqa
+            *{battle["nft_type"] for battle in recommended_battles}
+        )
 
         dict_battles = []
         for battle in recommended_battles:
-            pydantic_battle = PydanticBattle.from_orm(battle)  # noqa
-            dict_battle = pydantic_battle.dict()
-            dict_battle["uri"] = battle.uri
+            dict_battle = dict(battle)
+            dict_battle["uri"] = nft_resolver.cached_uri(  # noqa
+                battle["nft_type"], battle["nft_id"]
+            )
             dict_battles.append(dict_battle)
 
-        logging.debug(f"Client {sid} getting recommended battles: {dict_battles}")
-        return json.dumps(dict_battles)
+        logging.debug(f"Client {sid} getting {len(dict_battles)} recommended battles")
+        return encode_response(sid, dict_battles)
     except Exception as e:  # noqa
         logging.error("Error in get_battles_list:", exc_info=True)
 
@@ -245,58 +801,79 @@ async def get_recommended_battles(sid):
 @sio.event
 async def accept_offer(sid, data):  # noqa
     logging.info(f"Client {sid} accepting offer")
-    if clients[sid].state == ClientState.logging_in:
+    client = clients[sid]
+    if client.state == ClientState.logging_in:
         return ("authentication_error", "You need to log in first")
 
-    db_sess = database.create_session()  # noqa
-
     if not check_passed_data(data, "nft_id", "nft_type", "battle_id"):
         return ("wrong_input", "You need to pass 'nft_type','nft_id' and 'battle_id'")
 
-    battle = (
-        db_sess.query(Battle).filter(Battle.id == data["battle_id"]).first()  # noqa
-    )  # noqa
+    def query_battle(db_sess):
+        return (
+            db_sess.query(Battle).filter(Battle.id == data["battle_id"]).first()  # noqa
+        )  # noqa
+
+    battle = await database.run_in_session(query_battle, read_only=True)  # noqa
     if battle is None:
         logging.debug(
             f'Client {sid} accepting not existing battle with id: {data["battle_id"]}'
         )
         return ("wrong_input", "No such battle")
 
-    if battle.owner_address == clients[sid].address:
+    if battle.owner_address == client.address:
         logging.debug(f"Client {sid} accepting self created battle")
         return ("wrong_input", "Can not fight yourself")
 
     if battle.battle_state != BattleState.listed:  # noqa
+        recommendations.remove(battle.id)
         return ("wrong_input", "Battle already started")
 
+    # Creator is looked up first, so no accept is added to orphan battle
+    try:
+        creator_sid = battles[battle.id].creator.sid
+    except BaseException:
+        try:
+            creator_sid = await find_sid(battle.owner_address)
+        except ValueError:
+            recommendations.remove(battle.id)
+            return ("error", f"Can not find such battle with id {battle.id}")
+
     accept = Accept()  # noqa
-    accept.owner_address = clients[sid].address
+    accept.owner_address = client.address
     accept.nft_id = data["nft_id"]
     accept.nft_type = data["nft_type"]
-    accept.battle = battle
+    accept.battle_id = battle.id
 
-    db_sess.add(accept)
-    db_sess.flush()
-    db_sess.commit()
+    def add_accept(db_sess):
+        db_sess.add(accept)
+        db_sess.flush()
+        return accept
 
-    # TODO: Issue with disconnection of users must be fixed
-    try:
-        creator_sid = battles[battle.id]["creator"].sid
-    except BaseException:
-        owner_address = battle.owner_address
-        creator_sid = None
-        for sid in clients:
-            if clients[sid].address == owner_address:
-                creator_sid = sid
-        if creator_sid is None:
-            return ("error", f"Can not find such battle with id {battle.id}")
+    accept = await database.run_in_session(add_accept)  # noqa
+    query_cache.invalidate(("accepts", battle.id))
+
+    if client.sid not in clients:
+        # Disconnected while accept was saved, it could never be started
+        await database.run_in_session(delete_accept, accept.id)  # noqa
+        query_cache.invalidate(("accepts", battle.id))
+        return ("error", "Client disconnected")
 
     # Saving acceptor (access by accept_id)
-    accepts[accept.id] = {"creator": clients[sid]}
+    accepts.add(accept.id, battle.id, client)
+    await sio.enter_room(client.sid, applicants_room(battle.id))
+    if cluster is not None:
+        # Deleted when battle starts or is canceled, ttl - if worker died before
+        await cluster.store.set(
+            "accept",
+            accept.id,
+            {"sid": client.sid, "address": client.address},
+            ttl=ACCEPT_TTL,
+        )
 
     pydantic_accept = PydanticAccept.from_orm(accept)  # noqa
     dict_accept = pydantic_accept.dict()
 
+    await nft_resolver.prefetch(accept.nft_type)  # noqa
     dict_accept["uri"] = accept.uri
     dict_accept["bet"] = battle.bet
 
@@ -313,20 +890,28 @@ async def accepts_list(sid, data):
     if not check_passed_data(data, "battle_id"):
         return ("wrong_input", "You need to pass 'battle_id'")
 
-    db_sess = database.create_session()  # noqa
-
-    accepts = (
-        db_sess.query(Accept)  # noqa
-        .filter(Accept.battle_id == data["battle_id"])  # noqa
-        .all()
-    )  # noqa
-
-    dict_accepts = []
-    for accept in accepts:
-        pydantic_accept = PydanticAccept.from_orm(accept)  # noqa
-        dict_accepts.append(pydantic_accept.dict())
+    try:
+        battle_id = int(data["battle_id"])
+        params = get_page_params(data)
+    except (TypeError, ValueError):
+        return PAGE_PARAMS_ERROR
+
+    def query_accepts(db_sess, cursor):
+        query = accept_encoder.query(db_sess).filter(
+            Accept.battle_id == battle_id  # noqa
+        )
+        return keyset_page(
+            accept_encoder,
+            query,
+            Accept.id,  # noqa
+            cursor,
+            params["limit"],
+            params["order"],
+        )
 
-    return json.dumps(dict_accepts)
+    return await respond_list(
+        sid, "accepts_list_page", ("accepts", battle_id), query_accepts, params
+    )
 
 
 @sio.event
@@ -337,141 +922,249 @@ async def start_battle(sid, data):  # noqa
     if not check_passed_data(data, "battle_id", "accept_id"):
         return ("wrong_input", "You need to pass 'battle_id' and 'accept_id'")
 
-    db_sess = database.create_session()  # noqa
     # Getting battle and accept from DB
-    battle = (
-        db_sess.query(Battle).filter(Battle.id == data["battle_id"]).first()  # noqa
-    )  # noqa
+    def query_battle_and_accept(db_sess):
+        battle = (
+            db_sess.query(Battle).filter(Battle.id == data["battle_id"]).first()  # noqa
+        )  # noqa
+        accept = (
+            db_sess.query(Accept).filter(Accept.id == data["accept_id"]).first()  # noqa
+        )  # noqa
+        return battle, accept
+
+    battle, accept = await database.run_in_session(  # noqa
+        query_battle_and_accept, read_only=True
+    )
     if battle is None:
         return ("wrong_input", "Battle not found")
 
-    accept = (
-        db_sess.query(Accept).filter(Accept.id == data["accept_id"]).first()  # noqa
-    )  # noqa
-    if accept is None:
+    if accept is None or accept.battle_id != battle.id:
         return ("wrong_input", "Accept not found")
 
     # Check if battle already started
-    if battle.battle_state == BattleState.in_battle:  # noqa
+    if battle.battle_state != BattleState.listed:  # noqa
         return ("wrong_input", "Battle already started")
     if battle.owner_address == accept.owner_address:
         return ("wrong_input", "User can't fight himself")
 
     # Then gettign sids of both players
-    battle_creator = battles[battle.id]["creator"]
-    accept_creator = accepts[accept.id]["creator"]
+    battle_creator = battles[battle.id].creator
+    accept_creator = await get_accept_creator(accept.id)
+    if accept_creator is None:
+        return ("wrong_input", "Accept not found")
 
     if battle_creator.sid == accept_creator.sid:
         return ("wrong_input", "User can't fight himself")
 
     logging.info(f"Client {sid} starting battle with {accept_creator.sid}")
 
-    # Commiting that battle started and creator picked opponent
-    battle.battle_state = BattleState.in_battle  # noqa
-    battle.accepted_id = accept.id
-    db_sess.add(battle)
-    db_sess.commit()
+    # Commiting that battle started and creator picked opponent.
+    # Battle could be started by concurrent call since it was read,
+    # so it is updated only if it's still listed
+    battle_id = battle.id
 
-    # Both players now IN_BATTLE
-    clients[battle_creator.sid].state = ClientState.in_battle
-    clients[battle_creator.sid].current_battle = battle.id
-    clients[accept_creator.sid].state = ClientState.in_battle
-    clients[accept_creator.sid].current_battle = battle.id
+    def update_battle(db_sess):
+        started = (
+            db_sess.query(Battle)  # noqa
+            .filter(Battle.id == battle_id)  # noqa
+            .filter(Battle.battle_state == BattleState.listed)  # noqa
+            .update(
+                {
+                    Battle.battle_state: BattleState.in_battle,  # noqa
+                    Battle.accepted_id: accept.id,  # noqa
+                },
+                synchronize_session=False,
+            )
+        )
+        if not started:
+            return None, []
+        battle_db = db_sess.query(Battle).filter(Battle.id == battle_id).first()  # noqa
+        return battle_db, query_accept_ids(db_sess, [battle_id])
 
-    # Saving info about acceptor in battle
-    battles[battle.id]["acceptor"] = accept_creator
-    battles[battle.id]["creator_hp"] = 100
-    battles[battle.id]["acceptor_hp"] = 100
+    battle, accept_ids = await database.run_in_session(update_battle)  # noqa
+    if battle is None or battle_id not in battles:
+        return ("wrong_input", "Battle already started")
+    query_cache.invalidate(("battles", battle.owner_address))
 
-    first_round = Round()  # noqa
-    first_round.round_number = 1
-    first_round.battle = battle
-    battles[battle.id]["log"].append(first_round)
+    await begin_battle(battle.id, battle_creator, accept_creator)
+    accepts.remove_battle(battle.id)
+    await forget_accepts(accept_ids)
+    recommendations.remove(battle.id)
 
-    for a in battle.accepts:
-        if a.id != battle.accepted_id:
-            await sio.emit(
-                "battle_canceled",
-                {"battle_id": battle.id},
-                room=Client.get_sid_by_address(a.owner_address),
-            )
+    # Other accepts are canceled
+    await cancel_applicants(battle.id, skip_sid=accept_creator.sid)
 
     # Returning information about created battle (DB)
     pydantic_battle = PydanticBattle.from_orm(battle)  # noqa
     dict_battle = pydantic_battle.dict()
 
     await sio.emit("started_battle", json.dumps(dict_battle), room=accept_creator.sid)
-    # await sio.start_background_task(round_timeout, (battle.id))
     return json.dumps(dict_battle)
 
 
-async def round_timeout(battle_id):
-    logging.debug("timeout function started working")
-    # await sio.sleep(seconds=5.5)
-    time.sleep(10)
-    logging.debug("timeout for move")
+async def begin_battle(battle_id, battle_creator: Client, accept_creator: Client):
+    # Players waiting for automatic match are not matched into second battle
+    matchmaking.remove(battle_creator.sid)
+    matchmaking.remove(accept_creator.sid)
+    # Both players now IN_BATTLE
+    await update_client(battle_creator, ClientState.in_battle, battle_id)
+    await update_client(accept_creator, ClientState.in_battle, battle_id)
+    if cluster is not None:
+        # Moves of players from other workers are forwarded here
+        await cluster.store.set("battle", battle_id, {"worker": cluster.worker_id})
 
-    battle_info = battles[battle_id]
-    round_of_battle = battle_info["log"][-1]
-    logging.debug(f"ROUND: {round_of_battle}")
-    creator_info = battle_info["creator"]
-    acceptor_info = battle_info["acceptor"]
-
-    if len(round_of_battle.moves) == 1:
-        logging.debug("1 random move")
-        random_move = Move()  # noqa
-        random_move.round_id = round_of_battle.id
-        random_move.choice = random.choice(list(Choice))  # noqa # nosec
-        if round_of_battle.moves[0].owner_address == creator_info.address:
-            random_move.owner_address == acceptor_info.address
-        else:
-            random_move.owner_address == creator_info.address
-        round_of_battle.moves.append(random_move)
-    elif len(round_of_battle.moves) == 0:
-        logging.debug("2 random move")
-        first_move = Move()  # noqa
-        first_move.round_id = round_of_battle.id
-        first_move.choice = random.choice(list(Choice))  # noqa # nosec
-        first_move.owner_address = creator_info.address
-        round_of_battle.moves.append(first_move)
-
-        second_move = Move()  # noqa
-        second_move.round_id = round_of_battle.id
-        second_move.choice = random.choice(list(Choice))  # noqa # nosec
-        second_move.owner_address = acceptor_info.address
-        round_of_battle.moves.append(second_move)
-    else:
-        logging.debug("0 random move (round completed)")
-    round_of_battle.set_winner_user_address()
-    round_of_battle.winner_sid = Client.get_sid_by_address(
-        round_of_battle.winner_user_address
+    # Saving info about acceptor in battle
+    battles.set_state(battle_id, BattleState.in_battle)  # noqa
+    battles[battle_id].acceptor = accept_creator
+    round_timers.arm(battle_id, ROUND_TIMEOUT, round_timeout)
+
+
+def in_lobby(sid) -> bool:
+    client = clients.get(sid)
+    return client is not None and client.state == ClientState.in_menu
+
+
+@sio.event
+async def enqueue_match(sid, data):
+    client = clients[sid]
+    if client.state == ClientState.logging_in:
+        return ("authentication_error", "You need to log in first")
+    if client.state == ClientState.in_battle:
+        return ("wrong_input", "You are already in battle")
+    if sid in matchmaking:
+        return ("wrong_input", "You are already in the queue")
+
+    if not check_passed_data(data, "nft_type", "nft_id", "bet"):
+        return ("wrong_input", "You need to pass 'bet', 'nft_type' and 'nft_id'")
+    if not is_valid_bet(data["bet"]):
+        return ("wrong_input", "'bet' must be a finite number")
+
+    ticket = matchmaking.ticket(
+        sid, client.address, data["nft_type"], data["nft_id"], data["bet"]
     )
-    battles[battle_id]["log"][-1] = round_of_battle
-    await emit_ended_round(round_of_battle, creator_info, acceptor_info)
-    return
+    opponent = matchmaking.enqueue(ticket, in_lobby)
+    if opponent is None:
+        logging.info(f"Client {sid} waiting for match in tier {ticket.tier}")
+        return ("match_queued", {"tier": ticket.tier, "waiting": len(matchmaking)})
+
+    # Longer waiting player is the battle creator
+    return await start_matched_battle(opponent, ticket)
+
+
+async def start_matched_battle(creator, acceptor):
+    logging.info(f"Matched {creator.sid} with {acceptor.sid}")
+
+    # Battle and its accept are added in one transaction
+    def add_matched_battle(db_sess):
+        battle = Battle(  # noqa
+            owner_address=creator.address,
+            nft_id=creator.nft_id,
+            nft_type=creator.nft_type,
+            bet=creator.bet,
+            battle_state=BattleState.in_battle,  # noqa
+        )
+        db_sess.add(battle)
+        db_sess.flush()
+        accept = Accept(  # noqa
+            owner_address=acceptor.address,
+            nft_id=acceptor.nft_id,
+            nft_type=acceptor.nft_type,
+            battle_id=battle.id,
+        )
+        db_sess.add(accept)
+        db_sess.flush()
+        battle.accepted_id = accept.id
+        return battle
+
+    try:
+        battle = await database.run_in_session(add_matched_battle)  # noqa
+    except Exception:
+        logging.error("Adding matched battle failed", exc_info=True)
+        matchmaking.finish(creator, acceptor)
+        await sio.emit("match_canceled", {"reason": "error"}, room=creator.sid)
+        return ("error", "Can not start matched battle")
+    query_cache.invalidate(("battles", battle.owner_address))
+
+    if not in_lobby(creator.sid) or not in_lobby(acceptor.sid):
+        # One of players left (or started another battle) while battle
+        # was saved, other one waits again
+        await database.run_in_session(delete_battles, [battle.id])  # noqa
+        query_cache.invalidate(("battles", battle.owner_address))
+        matchmaking.finish(creator, acceptor)
+        await requeue_matched(creator, acceptor)
+        return ("match_queued", {"tier": acceptor.tier, "waiting": len(matchmaking)})
+
+    battle_creator = clients[creator.sid]
+    battles.add(battle.id, LiveBattle(battle_creator, BattleState.listed))  # noqa
+    try:
+        await begin_battle(battle.id, battle_creator, clients[acceptor.sid])
+    finally:
+        matchmaking.finish(creator, acceptor)
+
+    # Both players joined battle room in begin_battle
+    dict_battle = json.dumps(PydanticBattle.from_orm(battle).dict())  # noqa
+    await sio.emit("started_battle", dict_battle, room=participants_room(battle.id))
+    return dict_battle
+
 
+async def requeue_matched(*tickets):
+    for ticket in tickets:
+        if not in_lobby(ticket.sid):
+            continue
+        opponent = matchmaking.enqueue(ticket, in_lobby)
+        if opponent is not None:
+            await start_matched_battle(opponent, ticket)
 
-async def emit_ended_round(
-    round_of_battle, creator_info: Client, acceptor_info: Client
-):
-    battle = round_of_battle.battle
-    if round_of_battle.winner_sid == creator_info.sid:
-        battles[battle.id]["acceptor_hp"] -= 30
-    elif round_of_battle.winner_sid == acceptor_info.sid:
-        battles[battle.id]["creator_hp"] -= 30
+
+@sio.event
+async def leave_match_queue(sid, data=None):
+    if matchmaking.remove(sid) is None:
+        return ("wrong_input", "You are not in the queue")
+    return ("match_left", "You left the queue")
+
+
+async def round_timeout(battle_id):
+    # Fired by round_timers when players did not move in time
+    logging.debug(f"timeout for move in battle {battle_id}")
+    battle_info = battles.get(battle_id)
+    if battle_info is None or battle_info.state != BattleState.in_battle:  # noqa
+        return
+
+    # Players who did not move are moving randomly
+    if not battle_info.creator_choice:
+        battle_info.creator_choice = random.choice(list(Choice))  # noqa # nosec
+    if not battle_info.acceptor_choice:
+        battle_info.acceptor_choice = random.choice(list(Choice))  # noqa # nosec
+    await emit_ended_round(battle_id, battle_info)
+
+
+async def emit_ended_round(battle_id, battle_info: LiveBattle):
+    creator_info = battle_info.creator
+    acceptor_info = battle_info.acceptor
+    round_number = battle_info.round_number
+    creator_choice, acceptor_choice = battle_info.finish_round()
+
+    winner = get_round_winner(battle_info, creator_choice, acceptor_choice)
+    if winner is creator_info:
+        battle_info.acceptor_hp -= 30
+    elif winner is acceptor_info:
+        battle_info.creator_hp -= 30
+
+    is_battle_ended = battle_info.creator_hp <= 0 or battle_info.acceptor_hp <= 0
+    if is_battle_ended:
+        round_timers.cancel(battle_id)
+    else:
+        # Next round deadline starts now
+        round_timers.arm(battle_id, ROUND_TIMEOUT, round_timeout)
 
     # End of round event
     await sio.emit(
         "round_ended",
         {
-            "left_choice": round_of_battle.get_move_of_address(
-                creator_info.address
-            ).choice,
-            "right_choice": round_of_battle.get_move_of_address(
-                acceptor_info.address
-            ).choice,
-            "left_hp": battles[battle.id]["creator_hp"],
-            "right_hp": battles[battle.id]["acceptor_hp"],
+            "left_choice": creator_choice,
+            "right_choice": acceptor_choice,
+            "left_hp": battle_info.creator_hp,
+            "right_hp": battle_info.acceptor_hp,
         },
         room=creator_info.sid,
     )
@@ -479,18 +1172,84 @@ async def emit_ended_round(
     await sio.emit(
         "round_ended",
         {
-            "left_choice": round_of_battle.get_move_of_address(
-                acceptor_info.address
-            ).choice,
-            "right_choice": round_of_battle.get_move_of_address(
-                creator_info.address
-            ).choice,
-            "left_hp": battles[battle.id]["acceptor_hp"],  # acceptor
-            "right_hp": battles[battle.id]["creator_hp"],
+            "left_choice": acceptor_choice,
+            "right_choice": creator_choice,
+            "left_hp": battle_info.acceptor_hp,  # acceptor
+            "right_hp": battle_info.creator_hp,
         },  # creator
         room=acceptor_info.sid,
     )
 
+    # Spectators get only what changed (serialised once for all of them)
+    await sio.emit(
+        "spectated_round",
+        json.dumps(
+            {
+                "battle_id": battle_id,
+                "round_number": round_number,
+                "creator_choice": creator_choice,
+                "acceptor_choice": acceptor_choice,
+                "creator_hp": battle_info.creator_hp,
+                "acceptor_hp": battle_info.acceptor_hp,
+            }
+        ),
+        room=spectators_room(battle_id),
+    )
+
+    # Round is written to DB in background batches
+    await battle_log_writer.put(
+        {
+            "kind": "round",
+            "battle_id": battle_id,
+            "round_number": round_number,
+            "winner_user_address": "no_one" if winner is None else winner.address,
+            "winner_sid": "no_one" if winner is None else winner.sid,
+            "moves": [
+                (creator_info.address, Choice(creator_choice)),  # noqa
+                (acceptor_info.address, Choice(acceptor_choice)),  # noqa
+            ],
+        }
+    )
+
+    if is_battle_ended:
+        await end_battle(battle_id)
+
+
+async def broadcast_battle_ended(battle_id, winner_address):
+    for room in (participants_room(battle_id), spectators_room(battle_id)):
+        await sio.emit(
+            "battle_ended",
+            {"battle_id": battle_id, "winner": winner_address},
+            room=room,
+        )
+        await sio.close_room(room)
+
+
+async def end_battle(battle_id):
+    battle_info = battles[battle_id]
+    battles.set_state(battle_id, BattleState.ended)  # noqa
+    creator_info = battle_info.creator
+    acceptor_info = battle_info.acceptor
+
+    if battle_info.creator_hp > 0:
+        winner_address = creator_info.address
+    else:
+        winner_address = acceptor_info.address
+
+    await broadcast_battle_ended(battle_id, winner_address)
+    for client in (creator_info, acceptor_info):
+        await update_client(client, ClientState.in_menu, -1)
+
+    await battle_log_writer.put(
+        {
+            "kind": "ended",
+            "battle_id": battle_id,
+            "owner_address": battle_info.creator.address,
+        }
+    )
+    if cluster is not None:
+        await cluster.store.delete("battle", battle_id)
+
 
 @sio.event
 async def make_move(sid, data):  # noqa
@@ -499,93 +1258,52 @@ async def make_move(sid, data):  # noqa
 
     if not check_passed_data(data, "choice"):
         return ("wrong_input", "You need to pass choice")
+    try:
+        choice = Choice(data["choice"])  # noqa
+    except (TypeError, ValueError):
+        return ("wrong_input", "Choice must be 1 (attack), 2 (block) or 3 (trick)")
 
-    db_sess = database.create_session()  # noqa
+    # Battle state is taken from memory - no DB work on the hot path
     battle_id = clients[sid].current_battle
-    if battle_id is None:
+    if battle_id is None or battle_id == -1:
         return ("wrong_input", "No related to user battle found")
 
-    battle = (
-        db_sess.query(Battle).filter(Battle.id == battle_id).first()  # noqa
-    )  # noqa
+    if battle_id not in battles and cluster is not None:
+        # Battle is played on another worker - forwarding move there
+        owner = await cluster.store.get("battle", battle_id)
+        if owner is not None:
+            await cluster.send(
+                owner["worker"],
+                "make_move",
+                battle_id=battle_id,
+                sid=sid,
+                address=clients[sid].address,
+                choice=choice,
+            )
+            return ("maked_move", "Your move is registered")
 
-    if battle is None:
+    return await play_move(battle_id, sid, clients[sid].address, choice)
+
+
+async def play_move(battle_id, sid, address, choice):
+    battle_info = battles.get(battle_id)
+    if battle_info is None:
         return ("wrong_input", "No such battle")
-    if battle.battle_state != BattleState.in_battle:  # noqa
+    if battle_info.state != BattleState.in_battle:  # noqa
         return ("wrong_input", "Battle not started")
 
-    # Getting info about battle and both players
-    battle_info = battles[battle.id]
-    creator_info = battle_info["creator"]
-    acceptor_info = battle_info["acceptor"]
+    # Getting info about both players
+    creator_info = battle_info.creator
+    acceptor_info = battle_info.acceptor
 
     if not (creator_info.sid == sid or acceptor_info.sid == sid):
         return ("wrong_input", "You do not participate in this battle")
 
-    # Getting local logs and trying to get round if exists
-    log_of_battle = battle_info["log"]
-
-    # Round with one move - getting
-    # Round with two moves - create another one
-    if len(log_of_battle[-1].moves) == 2:
-        round_of_battle = Round()  # noqa
-        round_of_battle.round_number = len(log_of_battle) + 1
-        round_of_battle.battle = battle
-        is_round_new = True
-    elif len(log_of_battle[-1].moves) <= 1:
-        round_of_battle = log_of_battle[-1]
-        is_round_new = False
-
-    move = Move()  # noqa
-    move.owner_address = clients[sid].address
-    move.choice = data["choice"]
-
-    # Adding move to round
-    round_of_battle.moves.append(move)
-
-    # Check if enough moves
-    if len(round_of_battle.moves) == 2:
-
-        # Player2 is a player who made last move so his sid is in "sid" var
-        player1 = round_of_battle.moves[0]  # != sid
-        player2 = round_of_battle.moves[1]  # sid
-
-        # Game logic
-        if player1.choice == player2.choice:
-            round_of_battle.winner_user_address = "no_one"
-            round_of_battle.winner_sid = "no_one"
-        else:
-            if player1.choice == Choice.attack:  # noqa
-                if player2.choice == Choice.trick:  # noqa
-                    round_of_battle.winner_user_address = player1.owner_address
-                else:
-                    round_of_battle.winner_user_address = player2.owner_address
-            elif player1.choice == Choice.trick:  # noqa
-                if player2.choice == Choice.block:  # noqa
-                    round_of_battle.winner_user_address = player1.owner_address
-                else:
-                    round_of_battle.winner_user_address = player2.owner_address
-            elif player1.choice == Choice.block:  # noqa
-                if player2.choice == Choice.attack:  # noqa
-                    round_of_battle.winner_user_address = player1.owner_address
-                else:
-                    round_of_battle.winner_user_address = player2.owner_address
-            round_of_battle.winner_sid = Client.get_sid_by_address(
-                round_of_battle.winner_user_address
-            )
-
-    # If there is a winner - emitting end of round
-    if round_of_battle.winner_user_address is not None:
-        await emit_ended_round(round_of_battle, creator_info, acceptor_info)
+    # Second move of the round ends it
+    if battle_info.set_choice(address, choice):
+        await emit_ended_round(battle_id, battle_info)
         return
 
-    # After checking if we had winner - adding round with moves to local log
-    if is_round_new:
-        battles[battle.id]["log"].append(round_of_battle)
-        # await sio.start_background_task(round_timeout, (battle_id))
-    else:
-        battles[battle.id]["log"][-1] = round_of_battle
-
     # Sending both players event about move.
     # if sid == creator_info.sid:
     #     await sio.emit("opponent_maked_move", 'Your opponmove has made a move', room=acceptor_info.sid)
@@ -595,6 +1313,165 @@ async def make_move(sid, data):  # noqa
     return ("maked_move", "Your move is registered")
 
 
+def battle_snapshot(battle_id, battle_info: LiveBattle) -> str:
+    """Serialised battle for new spectators (cached till the next round)"""
+    if battle_info.snapshot is None:
+        battle_info.snapshot = json.dumps(
+            {
+                "battle_id": battle_id,
+                "state": battle_info.state,
+                "creator": battle_info.creator.address,
+                "acceptor": battle_info.acceptor.address,
+                "creator_hp": battle_info.creator_hp,
+                "acceptor_hp": battle_info.acceptor_hp,
+                # [round number, creator choice, acceptor choice]
+                "rounds": [list(round) for round in battle_info.log],
+            }
+        )
+    return battle_info.snapshot
+
+
+@sio.event
+async def spectate_battle(sid, data):
+    logging.info(f"Client {sid} spectating battle")
+    if clients[sid].state == ClientState.logging_in:
+        return ("authentication_error", "You need to log in first")
+
+    if not check_passed_data(data, "battle_id"):
+        return ("wrong_input", "You need to pass 'battle_id'")
+
+    # In cluster mode only battles played on this worker can be watched
+    battle_info = battles.get(data["battle_id"])
+    if battle_info is None:
+        return ("wrong_input", "No such battle")
+    if battle_info.state == BattleState.listed:  # noqa
+        return ("wrong_input", "Battle not started")
+    if battle_info.state != BattleState.in_battle:  # noqa
+        # Its room was closed when battle ended, nothing would close new one
+        return ("wrong_input", "Battle already ended")
+
+    # Rounds ended after joining come as "spectated_round" deltas
+    await sio.enter_room(sid, spectators_room(data["battle_id"]))
+    return battle_snapshot(data["battle_id"], battle_info)
+
+
+@sio.event
+async def stop_spectating(sid, data):
+    if not check_passed_data(data, "battle_id"):
+        return ("wrong_input", "You need to pass 'battle_id'")
+    await sio.leave_room(sid, spectators_room(data["battle_id"]))
+    return ("stopped_spectating", data["battle_id"])
+
+
+def round_dict(battle_id, round_number, winner_user_address, winner_sid) -> dict:
+    # Same fields as PydanticRound
+    return {
+        "id": None,
+        "round_number": round_number,
+        "winner_user_address": winner_user_address,
+        "winner_sid": winner_sid,
+        "battle_id": battle_id,
+    }
+
+
+async def live_battle_log(battle_id, battle_info: LiveBattle) -> list:
+    dict_log = []
+    if battle_info.log.dropped:
+        # Rounds over log cap are taken from DB
+        def query_rounds(db_sess):
+            return round_encoder.all(
+                round_encoder.query(db_sess)
+                .filter(Round.battle_id == battle_id)  # noqa
+                .filter(Round.round_number <= battle_info.log.dropped)  # noqa
+                .order_by(Round.round_number)  # noqa
+            )
+
+        dict_log = await database.run_in_session(query_rounds, read_only=True)  # noqa
+
+    for round_number, creator_choice, acceptor_choice in battle_info.log:
+        winner = get_round_winner(battle_info, creator_choice, acceptor_choice)
+        if winner is None:
+            dict_log.append(round_dict(battle_id, round_number, "no_one", "no_one"))
+        else:
+            dict_log.append(
+                round_dict(battle_id, round_number, winner.address, winner.sid)
+            )
+
+    if battle_info.state == BattleState.in_battle:  # noqa
+        # Current round is not finished yet
+        dict_log.append(round_dict(battle_id, battle_info.round_number, None, None))
+    return dict_log
+
+
+def start_profiler(seconds: float):
+    profiler.start()
+    started = profiler.started
+    # Stopped after seconds unless it was restarted meanwhile
+    asyncio.get_running_loop().call_later(seconds, stop_profiler, started)
+
+
+def stop_profiler(started: float = None):
+    if started is not None and profiler.started != started:
+        return None
+    path = profiler.stop()
+    if path is not None:
+        logging.warning(f"Profile written to {path}")
+    return path
+
+
+def toggle_profiler():
+    if profiler.running:
+        stop_profiler()
+    else:
+        start_profiler(PROFILE_SECONDS)
+
+
+def check_admin(sid):
+    """Error response if sid is not logged in admin"""
+    client = clients[sid]
+    if client.state == ClientState.logging_in:
+        return ("authentication_error", "You need to log in first")
+    if client.address not in ADMIN_ADDRESSES:
+        return ("authentication_error", "Only admins can do it")
+    return None
+
+
+@sio.event
+async def admin_profiler(sid, data):
+    error = check_admin(sid)
+    if error is not None:
+        return error
+
+    if not isinstance(data, dict) or data.get("action") not in ("start", "stop"):
+        return ("wrong_input", "'action' must be 'start' or 'stop'")
+    if data["action"] == "stop":
+        return ("profiler_stopped", stop_profiler())
+
+    try:
+        seconds = float(data.get("seconds", PROFILE_SECONDS))
+    except (TypeError, ValueError):
+        return ("wrong_input", "'seconds' must be a number")
+    if profiler.running:
+        return ("wrong_input", "Profiler is already running")
+    start_profiler(seconds)
+    logging.warning(f"Profiler started by {clients[sid].address} for {seconds}s")
+    return ("profiler_started", seconds)
+
+
+@sio.event
+async def admin_diagnostics(sid, data=None):
+    error = check_admin(sid)
+    if error is not None:
+        return error
+    return json.dumps(
+        {
+            "loop": loop_monitor.stats(),
+            "reports": [report.dict() for report in loop_monitor.reports],
+            "profiler_running": profiler.running,
+        }
+    )
+
+
 @sio.event
 async def get_battle_log(sid, data):
     # Getting id of battle
@@ -605,29 +1482,259 @@ async def get_battle_log(sid, data):
     if not check_passed_data(data, "battle_id"):
         return ("wrong_input", "You need to pass 'battle_id'")
 
-    db_sess = database.create_session()  # noqa
-
     battle_id = data["battle_id"]
-    battle = db_sess.query(Battle).filter(Battle.id == battle_id).first()  # noqa
 
-    if battle.log == []:
-        battle_log = battles[battle.id]["log"]
-    else:
-        battle_log = battle.log
+    # Live battle - memory log is ahead of write-behind DB log
+    if battle_id in battles:
+        dict_log = await live_battle_log(battle_id, battles[battle_id])
+        return encode_response(sid, dict_log)
+
+    def query_log(db_sess):
+        battle_query = db_sess.query(Battle.id).filter(Battle.id == battle_id)  # noqa
+        if battle_query.scalar() is None:
+            return None
+        return round_encoder.all(
+            round_encoder.query(db_sess).filter(Round.battle_id == battle_id)  # noqa
+        )
 
-    dict_log = []
-    for round in battle_log:
-        pydantic_round = PydanticRound.from_orm(round)  # noqa
-        dict_log.append(pydantic_round.dict())
+    dict_log = await database.run_in_session(query_log, read_only=True)  # noqa
+    if dict_log is None:
+        return ("wrong_input", "No such battle")
 
     # TODO: Returning winner_user_id=NULL on not finished round
-    return json.dumps(dict_log)
+    return encode_response(sid, dict_log)
+
+
+def evict_battles(now: float) -> list:
+    """Dropping ended battles and returning abandoned ones (evicted too)"""
+    for battle_id in battles.idle_in_state(
+        BattleState.ended, now - ENDED_BATTLE_TTL  # noqa
+    ):
+        battles.remove(battle_id)
+        reaper_stats["evicted_accepts"] += accepts.remove_battle(battle_id)
+        reaper_stats["evicted_battles"] += 1
+
+    abandoned = []
+    for battle_id in battles.idle_in_state(
+        BattleState.in_battle, now - IDLE_BATTLE_TTL  # noqa
+    ):
+        abandoned.append((battle_id, battles.remove(battle_id)))
+        reaper_stats["evicted_accepts"] += accepts.remove_battle(battle_id)
+        reaper_stats["abandoned_battles"] += 1
+
+    # Accepts which can not be started anymore (their battle is gone)
+    for accept_id, battle_id in accepts.items():
+        battle_info = battles.get(battle_id)
+        if battle_info is None or battle_info.state != BattleState.listed:  # noqa
+            accepts.remove(accept_id)
+            reaper_stats["leaked_accepts"] += 1
+    return abandoned
+
+
+async def cancel_abandoned_battle(battle_id, battle_info: LiveBattle):
+    round_timers.cancel(battle_id)
+    await broadcast_battle_ended(battle_id, "no_one")
+    for client in (battle_info.creator, battle_info.acceptor):
+        if client.current_battle == battle_id:
+            await update_client(client, ClientState.in_menu, -1)
+    # Marked ended in DB together with other battles of the batch
+    await battle_log_writer.put(
+        {
+            "kind": "ended",
+            "battle_id": battle_id,
+            "owner_address": battle_info.creator.address,
+        }
+    )
+    if cluster is not None:
+        await cluster.store.delete("battle", battle_id)
+
+
+async def reap():
+    """One pass of the reaper"""
+    async with battles.lock:
+        abandoned = evict_battles(time.monotonic())
+    for battle_id, battle_info in abandoned:
+        logging.info(f"Battle {battle_id} abandoned - ending it")
+        await cancel_abandoned_battle(battle_id, battle_info)
+
+
+async def run_reaper():
+    while True:
+        await asyncio.sleep(REAP_INTERVAL)
+        try:
+            await reap()
+        except Exception:
+            logging.error("Reaping battles failed", exc_info=True)
+        logging.debug(f"Memory: {memory_stats()}")
+
+
+def memory_stats() -> dict:
+    return {
+        "clients": len(clients),
+        "battles": len(battles),
+        "listed_battles": len(battles.in_state(BattleState.listed)),  # noqa
+        "live_battles": len(battles.in_state(BattleState.in_battle)),  # noqa
+        "ended_battles": len(battles.in_state(BattleState.ended)),  # noqa
+        "accepts": len(accepts),
+        "recommendations": len(recommendations),
+        "sessions": len(sessions),
+        "round_timers": len(round_timers),
+        "query_cache_rows": query_cache.weight,
+        **reaper_stats,
+    }
+
+
+def end_stale_battles(db_sess):
+    # Battles which were played when server stopped can not be continued
+    ended = (
+        db_sess.query(Battle)  # noqa
+        .filter(Battle.battle_state == BattleState.in_battle)  # noqa
+        .update(
+            {Battle.battle_state: BattleState.ended},  # noqa
+            synchronize_session=False,
+        )
+    )
+    # Creators of listed battles are disconnected - offers are canceled
+    # as on disconnect (they can't be started and are not recommended)
+    listed_ids = [
+        battle_id
+        for battle_id, in db_sess.query(Battle.id).filter(  # noqa
+            Battle.battle_state == BattleState.listed  # noqa
+        )
+    ]
+    if listed_ids:
+        delete_battles(db_sess, listed_ids)
+    return ended, len(listed_ids)
 
 
-if __name__ == "__main__":
+async def start_signature_verifier(app, loop):
+    # Login wave after deploy doesn't wait for pool workers to start
+    await signature_verifier.start()
+
+
+async def close_stale_battles(app, loop):
+    if cluster is not None:
+        # Other workers may be playing them
+        return
+    ended, canceled = await database.run_in_session(end_stale_battles)  # noqa
+    if ended or canceled:
+        logging.info(
+            f"Battles left from previous run: {ended} marked ended, "
+            f"{canceled} listed canceled"
+        )
+
+
+if cluster is not None:
+
+    @cluster.on("make_move")
+    async def remote_make_move(message):
+        result = await play_move(
+            message["battle_id"], message["sid"], message["address"], message["choice"]
+        )
+        if result is not None and result[0] != "maked_move":
+            logging.debug(f"Forwarded move of {message['sid']} refused: {result}")
+
+    @cluster.on("client_update")
+    async def remote_client_update(message):
+        client = clients.get(message["sid"])
+        if client is not None:
+            client.state = message["state"]
+            client.current_battle = message["current_battle"]
+            await join_battle_room(client)
+
+
+def nft_resolver_stats() -> dict:
+    return {
+        "rpc_calls": nft_resolver.rpc_calls,  # noqa
+        "hits": nft_resolver.hits,  # noqa
+        "misses": nft_resolver.misses,  # noqa
+    }
+
+
+def rate_limit_key(sid) -> str:
+    client = clients.get(sid)
+    if client is None or not client.address:
+        return sid
+    return client.address
+
+
+# All handlers are registered above, wrapping them once.
+# Rate limiter is outer one - refused calls don't reach handler stats
+metrics.instrument_server(sio)
+rate_limiter.guard_server(sio, rate_limit_key)
+metrics.add_collector("memory", memory_stats, counters=reaper_stats)
+metrics.add_collector(
+    "auth", signature_verifier.stats, counters=("recovered", "cache_hits")
+)
+metrics.add_collector(
+    "query_cache",
+    query_cache.stats,
+    counters=("hits", "misses", "invalidations", "evictions"),
+)
+metrics.add_collector(
+    "round_timers", round_timers.stats, counters=("fired", "canceled")
+)
+metrics.add_collector(
+    "battle_log",
+    battle_log_writer.stats,
+    counters=("flushed", "batches", "retried", "failed"),
+)
+metrics.add_collector(
+    "nft_resolver", nft_resolver_stats, counters=("rpc_calls", "hits", "misses")
+)
+metrics.add_collector("loop", loop_monitor.stats, counters=("stalls", "slow_handlers"))
+metrics.add_collector(
+    "matchmaking", matchmaking.stats, counters=("enqueued", "matched", "left")
+)
+metrics.add_collector("rate_limit", rate_limiter.stats, counters=("limited", "shed"))
+metrics.add_histogram("match_wait", matchmaking.wait)
+
+
+def create_app() -> Sanic:
+    """Sanic app with Socket.IO server, background tasks and listeners"""
     app = Sanic(name="GameBack")
     sio.attach(app)
 
+    @app.route("/metrics")
+    async def export_metrics(request):
+        return response.text(metrics.render(), content_type="text/plain; version=0.0.4")
+
+    app.add_task(nft_resolver.run_refresh())  # noqa
+    app.add_task(round_timers.run())
+    app.add_task(expire_sessions())
+    app.add_task(run_reaper())
+    app.add_task(loop_monitor.run())
+    if cluster is not None:
+        app.add_task(cluster.listen())
+
+    app.register_listener(start_signature_verifier, "before_server_start")
+
+    @app.listener("after_server_start")
+    async def start_battle_log_writer(app, loop):
+        battle_log_writer.start()
+
+    app.register_listener(close_stale_battles, "after_server_start")
+
+    @app.listener("after_server_start")
+    async def watch_profiler_signal(app, loop):
+        # kill -USR1 <pid> starts profiling for PROFILE_SECONDS, second one stops
+        if hasattr(signal, "SIGUSR1"):
+            loop.add_signal_handler(signal.SIGUSR1, toggle_profiler)
+
+    @app.listener("before_server_stop")
+    async def flush_battle_log_writer(app, loop):
+        await battle_log_writer.close()
+
+    @app.listener("after_server_stop")
+    async def close_database(app, loop):
+        database.shutdown_executors()  # noqa
+        signature_verifier.shutdown()
+        stop_profiler()
+
+    return app
+
+
+if __name__ == "__main__":
     logging.basicConfig(
         # filename='app.log',
         filemode="w",
@@ -635,4 +1742,14 @@ if __name__ == "__main__":
         format="%(asctime)s | %(levelname)s - %(message)s",
     )
 
-    app.run("0.0.0.0", 80)  # nosec
+    # Several workers need shared emits and state - each of them would keep
+    # its own clients and battles and end others' battles on restart
+    workers = int(os.environ.get("WORKERS", "1"))
+    if workers > 1 and (not CLUSTER_URL or CLUSTER_URL.startswith("memory://")):
+        raise SystemExit("WORKERS > 1 needs CLUSTER_URL=redis://...")
+
+    # Worker processes import this module again and build app by factory
+    loader = AppLoader(factory=create_app)
+    app = loader.load()
+    app.prepare("0.0.0.0", 80, workers=workers)  # nosec
+    Sanic.serve(primary=app, app_loader=loader)
@@ -0,0 +1,126 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+from eth_account import Account  # type: ignore
+from eth_account.messages import encode_defunct  # type: ignore
+
+
+def recover_address(message: str, signature: str) -> str:
+    """Address which signed message (keccak + secp256k1 recovery, CPU bound)"""
+    return Account.recover_message(encode_defunct(text=message), signature=signature)
+
+
+def warm_up() -> int:
+    # No-op run once by every worker, so it is started before logins come
+    return os.getpid()
+
+
+def pool_context():
+    """
+    Workers are forked from fresh single-threaded fork server
+    (spawned where fork server is not available)
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+class SignatureVerifier:
+    """
+    Recovers signer addresses in bounded process pool, so login waves
+    use all cores and don't block the event loop.
+    Results are cached by (message, signature).
+    workers=0 - recovering in the loop thread (tests, tiny deployments).
+    """
+
+    def __init__(
+        self, workers: int = None, max_pending: int = 1024, cache_size: int = 10000
+    ):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.cache_size = cache_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.max_pending = max_pending
+        self._cache: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+
+        self.pending = 0
+        self.recovered = 0
+        self.cache_hits = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Pool is created when DB, watchdog and flusher threads run -
+            # forking them may deadlock on locks held at fork time
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=pool_context()
+            )
+        return self._executor
+
+    async def start(self):
+        """Starting pool workers (forked and importing eth_account) ahead"""
+        if self.workers == 0:
+            return
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *(loop.run_in_executor(self.executor, warm_up) for _ in range(self.workers))
+        )
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created lazily to be bound to the running loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_pending)
+        return self._semaphore
+
+    async def recover(self, message: str, signature: str) -> str:
+        key = (message, signature)
+        address = self._cache.get(key)
+        if address is not None:
+            self.cache_hits += 1
+            self._cache.move_to_end(key)
+            return address
+
+        started = time.perf_counter()
+        self.pending += 1
+        try:
+            # Over max_pending requests wait here, not in pool queue
+            async with self.semaphore:
+                if self.workers == 0:
+                    address = recover_address(message, signature)
+                else:
+                    address = await asyncio.get_running_loop().run_in_executor(
+                        self.executor, recover_address, message, signature
+                    )
+        finally:
+            self.pending -= 1
+
+        latency = time.perf_counter() - started
+        self.recovered += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+
+        self._cache[key] = address
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return address
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "recovered": self.recovered,
+            "cache_hits": self.cache_hits,
+            "latency_avg": self.latency_total / self.recovered if self.recovered else 0,
+            "latency_max": self.latency_max,
+        }
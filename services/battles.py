@@ -0,0 +1,229 @@
+import asyncio
+import time
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+# Finished rounds kept in memory per battle (older ones are only in DB)
+ROUND_LOG_CAP = 64
+
+
+class RoundLog:
+    """
+    Finished rounds of battle as (creator choice, acceptor choice)
+    byte pairs. Only last `cap` rounds are kept.
+    """
+
+    __slots__ = ("cap", "dropped", "_choices")
+
+    def __init__(self, cap: int = ROUND_LOG_CAP):
+        self.cap = cap
+        # Rounds dropped over cap
+        self.dropped = 0
+        self._choices = bytearray()
+
+    def __len__(self) -> int:
+        return self.dropped + len(self._choices) // 2
+
+    def append(self, creator_choice: int, acceptor_choice: int):
+        self._choices += bytes((creator_choice, acceptor_choice))
+        if len(self._choices) > 2 * self.cap:
+            del self._choices[:2]
+            self.dropped += 1
+
+    def __iter__(self) -> Iterator[Tuple[int, int, int]]:
+        """(round number, creator choice, acceptor choice) of kept rounds"""
+        choices = self._choices
+        for index in range(0, len(choices), 2):
+            round_number = self.dropped + index // 2 + 1
+            yield round_number, choices[index], choices[index + 1]
+
+
+class LiveBattle:
+    """In-memory state of listed or played battle"""
+
+    __slots__ = (
+        "creator",
+        "acceptor",
+        "state",
+        "creator_hp",
+        "acceptor_hp",
+        "creator_choice",
+        "acceptor_choice",
+        "log",
+        "updated",
+        "snapshot",
+    )
+
+    def __init__(self, creator, state, log_cap: int = ROUND_LOG_CAP):
+        self.creator = creator
+        self.acceptor = None
+        self.state = state
+        self.creator_hp = 100
+        self.acceptor_hp = 100
+        # Moves of current round (0 - not made yet)
+        self.creator_choice = 0
+        self.acceptor_choice = 0
+        self.log = RoundLog(log_cap)
+        # Last state change or player move (time.monotonic)
+        self.updated = time.monotonic()
+        # Serialised state for spectators, dropped on every change
+        self.snapshot: Optional[str] = None
+
+    @property
+    def round_number(self) -> int:
+        return len(self.log) + 1
+
+    def set_choice(self, address: str, choice: int) -> bool:
+        """Registering move of participant, True when both moves are made"""
+        self.updated = time.monotonic()
+        if address == self.creator.address:
+            self.creator_choice = int(choice)
+        else:
+            self.acceptor_choice = int(choice)
+        return bool(self.creator_choice and self.acceptor_choice)
+
+    def finish_round(self) -> Tuple[int, int]:
+        choices = (self.creator_choice, self.acceptor_choice)
+        self.log.append(*choices)
+        self.creator_choice = self.acceptor_choice = 0
+        self.snapshot = None
+        return choices
+
+
+class BattleRegistry:
+    """
+    In-memory battles by id with indexes by creator sid, creator
+    address and state, so per-client work is O(own battles).
+    State must be changed with `set_state` to keep indexes correct.
+    """
+
+    def __init__(self):
+        self._battles: Dict[int, LiveBattle] = {}
+        self._by_creator_sid: Dict[str, Set[int]] = {}
+        self._by_creator_address: Dict[str, Set[int]] = {}
+        self._by_state: Dict[int, Set[int]] = {}
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        # Created lazily to be bound to the running loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def __getitem__(self, battle_id: int) -> LiveBattle:
+        return self._battles[battle_id]
+
+    def __contains__(self, battle_id) -> bool:
+        return battle_id in self._battles
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._battles)
+
+    def __len__(self) -> int:
+        return len(self._battles)
+
+    def get(self, battle_id: int, default=None):
+        return self._battles.get(battle_id, default)
+
+    @staticmethod
+    def _index(index: Dict, key, battle_id: int):
+        index.setdefault(key, set()).add(battle_id)
+
+    @staticmethod
+    def _unindex(index: Dict, key, battle_id: int):
+        ids = index.get(key)
+        if ids is None:
+            return
+        ids.discard(battle_id)
+        if not ids:
+            del index[key]
+
+    def add(self, battle_id: int, battle_info: LiveBattle):
+        creator = battle_info.creator
+        self._battles[battle_id] = battle_info
+        self._index(self._by_creator_sid, creator.sid, battle_id)
+        self._index(self._by_creator_address, creator.address, battle_id)
+        self._index(self._by_state, battle_info.state, battle_id)
+
+    def set_state(self, battle_id: int, state):
+        battle_info = self._battles[battle_id]
+        self._unindex(self._by_state, battle_info.state, battle_id)
+        battle_info.state = state
+        battle_info.updated = time.monotonic()
+        battle_info.snapshot = None
+        self._index(self._by_state, state, battle_id)
+
+    def remove(self, battle_id: int) -> LiveBattle:
+        battle_info = self._battles.pop(battle_id)
+        creator = battle_info.creator
+        self._unindex(self._by_creator_sid, creator.sid, battle_id)
+        self._unindex(self._by_creator_address, creator.address, battle_id)
+        self._unindex(self._by_state, battle_info.state, battle_id)
+        return battle_info
+
+    def rebind_creator_sid(self, old_sid: str, new_sid: str):
+        """Moving battles of resumed client to its new sid"""
+        ids = self._by_creator_sid.pop(old_sid, None)
+        if ids:
+            self._by_creator_sid.setdefault(new_sid, set()).update(ids)
+
+    def of_creator_sid(self, sid: str) -> List[int]:
+        return list(self._by_creator_sid.get(sid, ()))
+
+    def of_creator_address(self, address: str) -> List[int]:
+        return list(self._by_creator_address.get(address, ()))
+
+    def in_state(self, state) -> List[int]:
+        return list(self._by_state.get(state, ()))
+
+    def idle_in_state(self, state, idle_since: float) -> List[int]:
+        """Battles in state not updated since `idle_since` (time.monotonic)"""
+        return [
+            battle_id
+            for battle_id in self._by_state.get(state, ())
+            if self._battles[battle_id].updated < idle_since
+        ]
+
+
+class AcceptRegistry:
+    """Accept creators by accept id with battle id -> accept ids index"""
+
+    def __init__(self):
+        self._creators: Dict[int, object] = {}
+        self._battle_of: Dict[int, int] = {}
+        self._by_battle: Dict[int, Set[int]] = {}
+
+    def __getitem__(self, accept_id: int):
+        return self._creators[accept_id]
+
+    def __contains__(self, accept_id) -> bool:
+        return accept_id in self._creators
+
+    def __len__(self) -> int:
+        return len(self._creators)
+
+    def items(self):
+        """(accept id, battle id) pairs"""
+        return list(self._battle_of.items())
+
+    def add(self, accept_id: int, battle_id: int, creator):
+        self._creators[accept_id] = creator
+        self._battle_of[accept_id] = battle_id
+        self._by_battle.setdefault(battle_id, set()).add(accept_id)
+
+    def remove(self, accept_id: int):
+        creator = self._creators.pop(accept_id)
+        battle_id = self._battle_of.pop(accept_id)
+        ids = self._by_battle[battle_id]
+        ids.discard(accept_id)
+        if not ids:
+            del self._by_battle[battle_id]
+        return creator
+
+    def remove_battle(self, battle_id: int) -> int:
+        """Dropping all accepts of battle, returns how many were dropped"""
+        ids = self._by_battle.pop(battle_id, ())
+        for accept_id in ids:
+            del self._creators[accept_id]
+            del self._battle_of[accept_id]
+        return len(ids)
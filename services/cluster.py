@@ -0,0 +1,181 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import socketio  # type: ignore
+
+try:
+    from socketio.async_pubsub_manager import AsyncPubSubManager  # type: ignore
+except ImportError:  # python-socketio < 5.8
+    from socketio.asyncio_pubsub_manager import AsyncPubSubManager  # type: ignore
+
+KEY_PREFIX = "gameback"
+
+
+class LocalPubSubManager(AsyncPubSubManager):
+    """
+    In-process stand-in for AsyncRedisManager.
+    Servers created in one process with same channel see each other emits,
+    so cross-worker flows can be checked without Redis.
+    """
+
+    name = "local"
+    _subscribers: Dict[str, List[asyncio.Queue]] = {}
+
+    async def _publish(self, data):
+        message = self.json.dumps(data)
+        for queue in self._subscribers.get(self.channel, []):
+            queue.put_nowait(message)
+
+    async def _listen(self):
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(self.channel, []).append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers[self.channel].remove(queue)
+
+
+def make_client_manager(url: Optional[str]):
+    """Socket.IO client manager for cross-worker emits (None - single worker)"""
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return LocalPubSubManager(channel=url)
+    return socketio.AsyncRedisManager(url)
+
+
+class MemoryStateStore:
+    """Shared state store kept in process memory (single worker or tests)"""
+
+    def __init__(self):
+        self._data: Dict[str, str] = {}
+        # Key -> monotonic time it expires at (keys set with ttl)
+        self._expires: Dict[str, float] = {}
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+
+    async def get(self, namespace: str, key) -> Optional[dict]:
+        full_key = f"{KEY_PREFIX}:{namespace}:{key}"
+        if self._expires.get(full_key, float("inf")) <= time.monotonic():
+            await self.delete(namespace, key)
+        value = self._data.get(full_key)
+        return None if value is None else json.loads(value)
+
+    async def set(self, namespace: str, key, value: dict, ttl: float = None):
+        full_key = f"{KEY_PREFIX}:{namespace}:{key}"
+        self._data[full_key] = json.dumps(value)
+        if ttl is None:
+            self._expires.pop(full_key, None)
+        else:
+            self._expires[full_key] = time.monotonic() + ttl
+
+    async def delete(self, namespace: str, key):
+        self._data.pop(f"{KEY_PREFIX}:{namespace}:{key}", None)
+        self._expires.pop(f"{KEY_PREFIX}:{namespace}:{key}", None)
+
+    async def publish(self, channel: str, message: dict):
+        for queue in self._subscribers.get(channel, []):
+            queue.put_nowait(json.dumps(message))
+
+    async def subscribe(self, channel: str) -> AsyncIterator[dict]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(channel, []).append(queue)
+        try:
+            while True:
+                yield json.loads(await queue.get())
+        finally:
+            self._subscribers[channel].remove(queue)
+
+
+class RedisStateStore:
+    """Shared state store in Redis - visible to every worker and node"""
+
+    def __init__(self, url: str):
+        try:
+            import redis.asyncio as aioredis  # type: ignore
+        except ImportError:
+            raise RuntimeError("Install 'redis' package to use Redis state store")
+        self._redis = aioredis.from_url(url)
+
+    async def get(self, namespace: str, key) -> Optional[dict]:
+        value = await self._redis.get(f"{KEY_PREFIX}:{namespace}:{key}")
+        return None if value is None else json.loads(value)
+
+    async def set(self, namespace: str, key, value: dict, ttl: float = None):
+        await self._redis.set(
+            f"{KEY_PREFIX}:{namespace}:{key}",
+            json.dumps(value),
+            px=None if ttl is None else int(ttl * 1000),
+        )
+
+    async def delete(self, namespace: str, key):
+        await self._redis.delete(f"{KEY_PREFIX}:{namespace}:{key}")
+
+    async def publish(self, channel: str, message: dict):
+        await self._redis.publish(f"{KEY_PREFIX}:{channel}", json.dumps(message))
+
+    async def subscribe(self, channel: str) -> AsyncIterator[dict]:
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(f"{KEY_PREFIX}:{channel}")
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    yield json.loads(message["data"])
+        finally:
+            await pubsub.unsubscribe()
+
+
+_memory_stores: Dict[str, MemoryStateStore] = {}
+
+
+def make_state_store(url: str):
+    if url.startswith("memory://"):
+        # Same url - same store, so in-process workers share it
+        return _memory_stores.setdefault(url, MemoryStateStore())
+    return RedisStateStore(url)
+
+
+class Cluster:
+    """
+    Worker membership in multi-worker deployment.
+    Shared records (client sessions, accepts, battle owners) are kept
+    in state store. Live battle is owned by the worker which started it,
+    events of players connected to other workers are forwarded there.
+    """
+
+    def __init__(self, store, worker_id: str = None):
+        self.store = store
+        self.worker_id = worker_id or uuid.uuid4().hex
+        self._handlers: Dict[str, Callable[[dict], Awaitable]] = {}
+
+    def on(self, event: str):
+        def decorator(handler):
+            self._handlers[event] = handler
+            return handler
+
+        return decorator
+
+    async def send(self, worker_id: str, event: str, **payload):
+        await self.store.publish(f"worker:{worker_id}", {"event": event, **payload})
+
+    async def listen(self):
+        """Task handling messages forwarded to this worker"""
+        async for message in self.store.subscribe(f"worker:{self.worker_id}"):
+            handler = self._handlers.get(message.get("event"))
+            if handler is None:
+                logging.warning(f"Unknown cluster message {message}")
+                continue
+            try:
+                await handler(message)
+            except Exception:
+                logging.error(f"Cluster handler of {message} failed", exc_info=True)
+
+
+def make_cluster(url: Optional[str]) -> Optional[Cluster]:
+    if not url:
+        return None
+    return Cluster(make_state_store(url))
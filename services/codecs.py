@@ -0,0 +1,41 @@
+import json
+from typing import Callable, Dict, Iterable
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # optional fast JSON backend
+    orjson = None
+
+try:
+    import msgpack  # type: ignore
+except ImportError:  # optional binary backend
+    msgpack = None
+
+
+def dumps_json(value) -> str:
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value)
+
+
+# Codec name -> encoder of list endpoints responses
+# json    - JSON string inside Socket.IO frame (default, old clients)
+# native  - value itself, encoded once by Socket.IO frame
+# msgpack - bytes sent as Socket.IO binary attachment
+CODECS: Dict[str, Callable] = {"json": dumps_json, "native": lambda value: value}
+if msgpack is not None:
+    CODECS["msgpack"] = msgpack.packb
+
+DEFAULT_CODEC = "json"
+
+
+def negotiate(offered: Iterable[str]) -> str:
+    """First codec offered by client which server supports"""
+    for codec in offered:
+        if codec in CODECS:
+            return codec
+    return DEFAULT_CODEC
+
+
+def encode(codec: str, value):
+    return CODECS[codec](value)
@@ -0,0 +1,71 @@
+from typing import Dict, Iterator, List
+
+
+class ConnectionRegistry:
+    """
+    Connected clients by sid with reverse address -> sids index.
+    One address can be connected from several sockets, the latest
+    bound sid is used as main one.
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, object] = {}
+        # address -> sids (dict used as ordered set)
+        self._sids_by_address: Dict[str, Dict[str, None]] = {}
+
+    def __getitem__(self, sid: str):
+        return self._clients[sid]
+
+    def __contains__(self, sid) -> bool:
+        return sid in self._clients
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._clients)
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def get(self, sid: str, default=None):
+        return self._clients.get(sid, default)
+
+    def add(self, sid: str, client):
+        self._clients[sid] = client
+        address = getattr(client, "address", "")
+        if address:
+            self.bind_address(sid, address)
+
+    def bind_address(self, sid: str, address: str):
+        """Indexing sid by address (called after successful auth)"""
+        client = self._clients[sid]
+        old_address = getattr(client, "address", "")
+        if old_address and old_address != address:
+            self._unbind(sid, old_address)
+        client.address = address  # type: ignore
+        sids = self._sids_by_address.setdefault(address, {})
+        sids.pop(sid, None)
+        sids[sid] = None
+
+    def _unbind(self, sid: str, address: str):
+        sids = self._sids_by_address.get(address)
+        if sids is None:
+            return
+        sids.pop(sid, None)
+        if not sids:
+            del self._sids_by_address[address]
+
+    def remove(self, sid: str):
+        client = self._clients.pop(sid)
+        address = getattr(client, "address", "")
+        if address:
+            self._unbind(sid, address)
+        return client
+
+    def sids_of(self, address: str) -> List[str]:
+        return list(self._sids_by_address.get(address, ()))
+
+    def get_sid_by_address(self, address: str) -> str:
+        sids = self._sids_by_address.get(address)
+        if not sids:
+            raise ValueError(f"Not found client with address {address}")
+        # Latest connected socket of the address
+        return next(reversed(sids))
@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from typing import Deque, Dict, List, Optional
+
+from services import metrics as metrics_module
+
+
+def _is_handler_frame(frame) -> bool:
+    # Frame of Metrics.instrument wrapper, next frame is the handler itself
+    code = frame.f_code
+    return (
+        code.co_name == "instrumented" and code.co_filename == metrics_module.__file__
+    )
+
+
+def handler_event(frame) -> Optional[str]:
+    """Event of instrumented handler running in the stack (handler name)"""
+    inner = None
+    while frame is not None:
+        if inner is not None and _is_handler_frame(frame):
+            return inner.f_code.co_name
+        inner = frame
+        frame = frame.f_back
+    return None
+
+
+class Report:
+    __slots__ = ("kind", "event", "seconds", "stack", "at")
+
+    def __init__(self, kind: str, event: Optional[str], seconds: float, stack: str):
+        self.kind = kind
+        self.event = event
+        self.seconds = seconds
+        self.stack = stack
+        self.at = time.time()
+
+    def dict(self) -> dict:
+        return {
+            "kind": self.kind,
+            "event": self.event,
+            "seconds": self.seconds,
+            "stack": self.stack,
+            "at": self.at,
+        }
+
+
+class LoopMonitor:
+    """
+    Heartbeat task measures event loop lag (how late it wakes up).
+    Watchdog thread captures loop thread stack when the loop doesn't beat
+    for stall_threshold seconds - stack of blocking code and its handler.
+    Handlers running longer than slow_threshold (awaiting DB, RPC, ...)
+    are reported with stack of the point they are waiting at.
+    """
+
+    def __init__(
+        self,
+        metrics,
+        interval: float = 0.05,
+        stall_threshold: float = 0.1,
+        slow_threshold: float = 1.0,
+        keep: int = 50,
+    ):
+        self.metrics = metrics
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.slow_threshold = slow_threshold
+        self.reports: Deque[Report] = deque(maxlen=keep)
+        self._beat = time.monotonic()
+        self._thread_id: Optional[int] = None
+        self._stall: Optional[Report] = None
+        # Handler calls already reported as slow
+        self._reported: Dict[asyncio.Task, float] = {}
+
+        self.lag_last = 0.0
+        self.lag_max = 0.0
+        self.lag_total = 0.0
+        self.beats = 0
+        self.stalls = 0
+        self.slow_handlers = 0
+
+    async def run(self):
+        self._thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        watchdog = threading.Thread(target=self._watch, name="loop-watchdog")
+        watchdog.daemon = True
+        watchdog.start()
+        try:
+            await self._heartbeat()
+        finally:
+            # Watchdog exits too
+            self._thread_id = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._beat = now
+            lag = max(now - expected, 0.0)
+            self.lag_last = lag
+            self.lag_max = max(self.lag_max, lag)
+            self.lag_total += lag
+            self.beats += 1
+
+            stall = self._stall
+            if stall is not None:
+                # Loop is running again, stall took whole lag
+                self._stall = None
+                stall.seconds = lag
+                logging.warning(
+                    f"Event loop blocked for {lag:.3f}s in "
+                    f"{stall.event or 'no handler'}:\n{stall.stack}"
+                )
+            self._check_slow_handlers()
+
+    def _watch(self):
+        reported_beat = None
+        while self._thread_id is not None:
+            time.sleep(self.interval)
+            beat = self._beat
+            if beat == reported_beat:
+                continue
+            stalled = time.monotonic() - beat
+            if stalled < self.stall_threshold + self.interval:
+                continue
+            reported_beat = beat
+            frame = sys._current_frames().get(self._thread_id)  # type: ignore
+            if frame is None:
+                continue
+            report = Report(
+                "stall", handler_event(frame), stalled, "".join(format_stack(frame))
+            )
+            self.stalls += 1
+            self.reports.append(report)
+            self._stall = report
+
+    def _check_slow_handlers(self):
+        now = time.perf_counter()
+        for task in [t for t in self._reported if t not in self.metrics.running]:
+            del self._reported[task]
+        for task, (event, started) in list(self.metrics.running.items()):
+            if now - started < self.slow_threshold or task in self._reported:
+                continue
+            self._reported[task] = started
+            stack = "".join(format_awaits(task.get_coro()))
+            report = Report("slow_handler", event, now - started, stack)
+            self.slow_handlers += 1
+            self.reports.append(report)
+            logging.warning(
+                f"Handler {event} is running for {now - started:.3f}s:\n"
+                f"{report.stack}"
+            )
+
+    def stats(self) -> dict:
+        return {
+            "lag_last": self.lag_last,
+            "lag_max": self.lag_max,
+            "lag_avg": self.lag_total / self.beats if self.beats else 0.0,
+            "stalls": self.stalls,
+            "slow_handlers": self.slow_handlers,
+        }
+
+
+def format_stack(frame) -> List[str]:
+    return traceback.format_list(traceback.extract_stack(frame))
+
+
+def format_awaits(coro) -> List[str]:
+    """Stack of suspended coroutine down to the awaited future"""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is not None:
+            frames.append((frame, frame.f_lineno))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return traceback.format_list(traceback.StackSummary.extract(frames))
+
+
+def frame_name(frame) -> str:
+    code = frame.f_code
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+class SamplingProfiler:
+    """
+    Samples stack of the loop thread every `interval` seconds from
+    background thread. Result is written in folded stacks format
+    ("root;frame;frame count" lines) used by flamegraph.pl and speedscope.
+    Stacks are rooted at event of the running handler ("event:make_move"),
+    so handler regressions are seen separately.
+    """
+
+    def __init__(self, directory: str = "profiles", interval: float = 0.005):
+        self.directory = directory
+        self.interval = interval
+        self._samples: Counter = Counter()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.started = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, thread_id: int = None):
+        if self.running:
+            return
+        thread_id = threading.get_ident() if thread_id is None else thread_id
+        self._samples = Counter()
+        self._stop.clear()
+        self.started = time.time()
+        self._thread = threading.Thread(
+            target=self._sample, args=(thread_id,), name="sampling-profiler"
+        )
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _sample(self, thread_id: int):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)  # type: ignore
+            if frame is None:
+                continue
+            event = handler_event(frame)
+            names = []
+            while frame is not None:
+                names.append(frame_name(frame))
+                frame = frame.f_back
+            names.append(f"event:{event}" if event else "loop")
+            self._samples[";".join(reversed(names))] += 1
+
+    def stop(self) -> Optional[str]:
+        """Stopping profiler, returns path of written profile"""
+        if not self.running:
+            return None
+        self._stop.set()
+        self._thread.join()  # type: ignore
+        self._thread = None
+
+        os.makedirs(self.directory, exist_ok=True)
+        name = time.strftime("profile-%Y%m%d-%H%M%S.folded", time.gmtime(self.started))
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as file:
+            for stack, count in self._samples.most_common():
+                file.write(f"{stack} {count}\n")
+        return path
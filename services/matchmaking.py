@@ -0,0 +1,118 @@
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Sequence, Set
+
+from services.metrics import Histogram
+from services.recommendations import bet_value
+
+# Upper bounds (seconds) of queue wait histogram buckets
+WAIT_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class Ticket:
+    __slots__ = ("sid", "address", "nft_type", "nft_id", "bet", "tier", "enqueued")
+
+    def __init__(self, sid: str, address: str, nft_type, nft_id, bet, tier: int):
+        self.sid = sid
+        self.address = address
+        self.nft_type = nft_type
+        self.nft_id = nft_id
+        self.bet = bet
+        self.tier = tier
+        self.enqueued = time.monotonic()
+
+
+class MatchQueue:
+    """
+    Players waiting for opponent, bucketed by bet tier.
+    Bucket is FIFO ordered dict (sid -> ticket), so pairing with the
+    longest waiting player of the tier and leaving the queue are O(1).
+    tiers - upper bounds of bet tiers, bets over the last one share a tier.
+    """
+
+    def __init__(self, tiers: Sequence[float] = (1, 10, 100, 1000)):
+        self.tiers = sorted(tiers)
+        self._buckets: Dict[int, "OrderedDict[str, Ticket]"] = {
+            tier: OrderedDict() for tier in range(len(self.tiers) + 1)
+        }
+        self._tickets: Dict[str, Ticket] = {}
+        # Paired players whose battle is being created (can't enqueue again)
+        self._matching: Set[str] = set()
+
+        self.wait = Histogram(WAIT_BUCKETS)
+        self.enqueued = 0
+        self.matched = 0
+        self.left = 0
+
+    def __len__(self) -> int:
+        return len(self._tickets)
+
+    def __contains__(self, sid) -> bool:
+        return sid in self._tickets or sid in self._matching
+
+    def tier_of(self, bet) -> int:
+        return bisect_right(self.tiers, bet_value(bet))
+
+    def ticket(self, sid: str, address: str, nft_type, nft_id, bet) -> Ticket:
+        return Ticket(sid, address, nft_type, nft_id, bet, self.tier_of(bet))
+
+    def enqueue(
+        self, ticket: Ticket, available: Callable[[str], bool] = None
+    ) -> Optional[Ticket]:
+        """
+        Pairing ticket with waiting one of the same tier (it is returned
+        and leaves the queue), otherwise ticket waits in the queue.
+        Waiting tickets of sids which are not available (left the lobby)
+        are dropped on the way.
+        """
+        self.enqueued += 1
+        bucket = self._buckets[ticket.tier]
+        # Bucket is walked lazily from the oldest ticket till the opponent,
+        # visited stale tickets are removed after (dict can't change meanwhile)
+        stale = []
+        opponent = None
+        for sid, waiting in bucket.items():
+            if available is not None and not available(sid):
+                stale.append(sid)
+            # Same player from another socket is skipped
+            elif waiting.address != ticket.address:
+                opponent = waiting
+                break
+        for sid in stale:
+            self.remove(sid)
+
+        if opponent is None:
+            bucket[ticket.sid] = ticket
+            self._tickets[ticket.sid] = ticket
+            return None
+        del bucket[opponent.sid]
+        del self._tickets[opponent.sid]
+        self._matching.update((opponent.sid, ticket.sid))
+        self.matched += 2
+        now = time.monotonic()
+        self.wait.observe(now - opponent.enqueued)
+        self.wait.observe(now - ticket.enqueued)
+        return opponent
+
+    def finish(self, *tickets: Ticket):
+        """Battle of paired tickets is created (or failed)"""
+        for ticket in tickets:
+            self._matching.discard(ticket.sid)
+
+    def remove(self, sid: str) -> Optional[Ticket]:
+        ticket = self._tickets.pop(sid, None)
+        if ticket is not None:
+            del self._buckets[ticket.tier][sid]
+            self.left += 1
+        return ticket
+
+    def stats(self) -> dict:
+        waited = sum(self.wait.counts)
+        return {
+            "waiting": len(self._tickets),
+            "enqueued": self.enqueued,
+            "matched": self.matched,
+            "left": self.left,
+            "wait_avg": self.wait.sum / waited if waited else 0.0,
+        }
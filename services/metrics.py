@@ -0,0 +1,209 @@
+import asyncio
+import inspect
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+# Upper bounds (seconds) of latency histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        # Last one is +Inf bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self, name: str, labels: str = "") -> List[str]:
+        lines = []
+        total = 0
+        bucket_labels = f"{labels}," if labels else ""
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{{bucket_labels}le="{bound}"}} {total}')
+        labels = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{labels} {self.sum}")
+        lines.append(f"{name}_count{labels} {total}")
+        return lines
+
+
+class EventStats:
+    __slots__ = (
+        "calls",
+        "errors",
+        "latency",
+        "db_seconds",
+        "rpc_seconds",
+        "bytes_in",
+        "bytes_out",
+    )
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency = Histogram()
+        self.db_seconds = 0.0
+        self.rpc_seconds = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+
+# Stats of the handler running in current task (DB and RPC time goes there)
+current_event: ContextVar[Optional[EventStats]] = ContextVar(
+    "current_event", default=None
+)
+
+
+def payload_size(value) -> int:
+    """
+    Size of already encoded payload (str / bytes, also inside tuple).
+    Objects (decoded inputs, native codec responses) are not measured -
+    encoding them again would double serialisation cost of the call.
+    """
+    value_type = type(value)
+    if value_type is str or value_type is bytes:
+        return len(value)
+    if value_type is tuple:
+        size = 0
+        for item in value:
+            size += payload_size(item)
+        return size
+    return 0
+
+
+def is_error(result: tuple) -> bool:
+    # Handlers return errors as ("wrong_input", "...") / ("..._error", "...")
+    status = result[0] if result else None
+    return type(status) is str and (status == "wrong_input" or status.endswith("error"))
+
+
+class Metrics:
+    """
+    Socket.IO handlers stats, DB and RPC time and gauges
+    rendered in Prometheus text format.
+    """
+
+    def __init__(self, prefix: str = "gameback"):
+        self.prefix = prefix
+        self.events: Dict[str, EventStats] = {}
+        self.db = Histogram()
+        self.rpc = Histogram()
+        # Prefix -> function returning dict of numbers (rendered as gauges)
+        self.collectors: Dict[str, Callable[[], dict]] = {}
+        # Prefix -> keys of collected numbers which only grow (counters)
+        self.counters: Dict[str, FrozenSet[str]] = {}
+        # Name -> histogram of seconds kept by other services
+        self.histograms: Dict[str, Histogram] = {}
+        # Handler calls in progress: task -> (event, perf_counter at start)
+        self.running: Dict[asyncio.Task, Tuple[str, float]] = {}
+
+    def observe_db(self, seconds: float):
+        self.db.observe(seconds)
+        stats = current_event.get()
+        if stats is not None:
+            stats.db_seconds += seconds
+
+    def observe_rpc(self, seconds: float):
+        self.rpc.observe(seconds)
+        stats = current_event.get()
+        if stats is not None:
+            stats.rpc_seconds += seconds
+
+    def add_collector(
+        self, prefix: str, collect: Callable[[], dict], counters: Iterable[str] = ()
+    ):
+        self.collectors[prefix] = collect
+        self.counters[prefix] = frozenset(counters)
+
+    def add_histogram(self, name: str, histogram: Histogram):
+        self.histograms[name] = histogram
+
+    def instrument(self, event: str, handler):
+        stats = self.events.setdefault(event, EventStats())
+        running = self.running
+        # Socket.IO tries connect(sid, environ, auth) first, handler may take less
+        params = inspect.signature(handler).parameters.values()
+        if any(p.kind == p.VAR_POSITIONAL for p in params):
+            arity = None
+        else:
+            arity = len(params)
+
+        async def instrumented(*args):
+            if arity is not None and len(args) > arity:
+                args = args[:arity]
+            if event != "connect" and len(args) > 1:
+                stats.bytes_in += payload_size(args[1])
+            stats.calls += 1
+            token = current_event.set(stats)
+            task = asyncio.current_task()
+            started = time.perf_counter()
+            running[task] = (event, started)
+            try:
+                result = await handler(*args)
+            except BaseException:
+                stats.errors += 1
+                raise
+            finally:
+                stats.latency.observe(time.perf_counter() - started)
+                current_event.reset(token)
+                running.pop(task, None)
+
+            if type(result) is tuple and is_error(result):
+                stats.errors += 1
+            stats.bytes_out += payload_size(result)
+            return result
+
+        return instrumented
+
+    def instrument_server(self, sio):
+        """Wrapping all handlers registered in Socket.IO server"""
+        for handlers in sio.handlers.values():
+            for event, handler in handlers.items():
+                handlers[event] = self.instrument(event, handler)
+
+    def render(self) -> str:
+        p = self.prefix
+        lines = []
+        # Samples of one metric must be grouped under its TYPE line
+        counters = (
+            ("event_calls_total", "calls"),
+            ("event_errors_total", "errors"),
+            ("event_db_seconds_total", "db_seconds"),
+            ("event_rpc_seconds_total", "rpc_seconds"),
+            ("event_received_bytes_total", "bytes_in"),
+            ("event_sent_bytes_total", "bytes_out"),
+        )
+        for name, attr in counters:
+            lines.append(f"# TYPE {p}_{name} counter")
+            for event, stats in self.events.items():
+                lines.append(f'{p}_{name}{{event="{event}"}} {getattr(stats, attr)}')
+
+        lines.append(f"# TYPE {p}_event_seconds histogram")
+        for event, stats in self.events.items():
+            lines += stats.latency.render(f"{p}_event_seconds", f'event="{event}"')
+        lines.append(f"# TYPE {p}_call_seconds histogram")
+        lines += self.db.render(f"{p}_call_seconds", 'kind="db"')
+        lines += self.rpc.render(f"{p}_call_seconds", 'kind="rpc"')
+        for name, histogram in self.histograms.items():
+            lines.append(f"# TYPE {p}_{name}_seconds histogram")
+            lines += histogram.render(f"{p}_{name}_seconds")
+
+        for prefix, collect in self.collectors.items():
+            counters = self.counters[prefix]
+            for key, value in collect().items():
+                name = f"{p}_{prefix}_{key}"
+                if key in counters:
+                    lines.append(f"# TYPE {name}_total counter")
+                    lines.append(f"{name}_total {float(value)}")
+                else:
+                    lines.append(f"# TYPE {name} gauge")
+                    lines.append(f"{name} {float(value)}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+# Queued by close() to stop flush task after everything before it
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """
+    Write-behind buffer: items are queued by handlers and flushed
+    in batches by one task when batch is full or interval passed.
+    `put` waits when queue is full (backpressure), `close` flushes rest.
+    Failed batch is retried `retries` times with doubling backoff
+    (next batches wait, so order is kept), then dropped and logged
+    by item_key of its items.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[List], Awaitable],
+        max_batch: int = 256,
+        interval: float = 0.5,
+        maxsize: int = 10000,
+        retries: int = 3,
+        backoff: float = 0.5,
+        item_key: Callable[[Any], Any] = None,
+    ):
+        self.flush = flush
+        self.max_batch = max_batch
+        self.interval = interval
+        self.maxsize = maxsize
+        self.retries = retries
+        self.backoff = backoff
+        self.item_key = item_key
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.flushed = 0
+        self.batches = 0
+        self.retried = 0
+        self.failed = 0
+
+    @property
+    def queue(self) -> asyncio.Queue:
+        # Created lazily to be bound to the running loop
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+        return self._queue
+
+    def __len__(self) -> int:
+        return self.queue.qsize()
+
+    async def put(self, item):
+        await self.queue.put(item)
+
+    async def _flush(self, batch: List):
+        for attempt in range(self.retries + 1):
+            try:
+                await self.flush(batch)
+            except Exception as ex:
+                error = ex
+            else:
+                self.flushed += len(batch)
+                self.batches += 1
+                return
+            if attempt < self.retries:
+                delay = self.backoff * 2**attempt
+                self.retried += 1
+                logging.warning(
+                    f"Failed to flush {len(batch)} items ({error!r}), "
+                    f"retrying in {delay}s"
+                )
+                await asyncio.sleep(delay)
+
+        self.failed += len(batch)
+        keys = "" if self.item_key is None else f": {self._keys(batch)}"
+        logging.error(
+            f"Dropped {len(batch)} items after {self.retries + 1} attempts{keys}",
+            exc_info=error,
+        )
+
+    def _keys(self, batch: List) -> list:
+        keys = []
+        for item in batch:
+            key = self.item_key(item)  # type: ignore
+            if key not in keys:
+                keys.append(key)
+        return keys
+
+    async def _collect(self) -> Tuple[List, bool]:
+        """Batch of items and flag if stop was requested"""
+        item = await self.queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def run(self):
+        stopped = False
+        while not stopped:
+            batch, stopped = await self._collect()
+            if batch:
+                await self._flush(batch)
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self.run())
+        return self._task
+
+    async def close(self):
+        """Flushing everything queued and stopping flush task"""
+        if self._task is not None and not self._task.done():
+            await self.queue.put(_STOP)
+            await self._task
+            return
+
+        batch: List = []
+        while not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+            if len(batch) >= self.max_batch:
+                await self._flush(batch)
+                batch = []
+        if batch:
+            await self._flush(batch)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self),
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
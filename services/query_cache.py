@@ -0,0 +1,113 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Set, Tuple
+
+
+class _Entry:
+    __slots__ = ("value", "tag", "weight", "expires")
+
+    def __init__(self, value, tag, weight: int, expires: float):
+        self.value = value
+        self.tag = tag
+        self.weight = weight
+        self.expires = expires
+
+
+class QueryCache:
+    """
+    Read-through cache of query results with LRU eviction.
+    Every entry has a tag (e.g. ("battles", owner address)), writers
+    invalidate the tag and all its entries are dropped.
+    Memory is bounded by total weight (rows) of cached results.
+
+    Reader which started query before invalidation must not store
+    stale result, so `put` checks tag generation taken before query:
+
+        generation = cache.generation(tag)
+        value = await query()
+        cache.put(key, tag, generation, value, weight=len(value))
+
+    max_weight=0 - cache is disabled (e.g. several workers write DB).
+    """
+
+    def __init__(self, max_weight: int = 100000, ttl: float = 60):
+        self.max_weight = max_weight
+        self.ttl = ttl
+        self.weight = 0
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._keys_by_tag: Dict[Hashable, Set[Hashable]] = {}
+        # tag -> invalidations counter when it was invalidated last time
+        self._invalidated: Dict[Hashable, int] = {}
+        self._counter = 0
+        # Bumped when _invalidated is cleared, all older generations are stale
+        self._epoch = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable):
+        entry = self._entries.get(key)
+        if entry is None or entry.expires <= time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry.value
+
+    def generation(self, tag: Hashable) -> Tuple[int, int]:
+        return self._epoch, self._counter
+
+    def is_stale(self, tag: Hashable, generation: Tuple[int, int]) -> bool:
+        epoch, counter = generation
+        return epoch != self._epoch or self._invalidated.get(tag, -1) > counter
+
+    def put(self, key: Hashable, tag: Hashable, generation, value, weight: int = 1):
+        if self.is_stale(tag, generation) or weight > self.max_weight:
+            # Invalidated while querying or too big to be cached
+            return
+        if key in self._entries:
+            self._remove(key)
+        expires = time.monotonic() + self.ttl
+        self._entries[key] = _Entry(value, tag, weight, expires)
+        self._keys_by_tag.setdefault(tag, set()).add(key)
+        self.weight += weight
+        while self.weight > self.max_weight:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, tag: Hashable):
+        self.invalidations += 1
+        self._counter += 1
+        self._invalidated[tag] = self._counter
+        if len(self._invalidated) > max(self.max_weight, 1024):
+            self._invalidated.clear()
+            self._epoch += 1
+        for key in self._keys_by_tag.pop(tag, ()):
+            entry = self._entries.pop(key)
+            self.weight -= entry.weight
+
+    def _remove(self, key: Hashable) -> Optional[_Entry]:
+        entry = self._entries.pop(key)
+        self.weight -= entry.weight
+        keys = self._keys_by_tag[entry.tag]
+        keys.discard(key)
+        if not keys:
+            del self._keys_by_tag[entry.tag]
+        return entry
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "weight": self.weight,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+        }
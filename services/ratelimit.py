@@ -0,0 +1,158 @@
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# (tokens per second, bucket size)
+Budget = Tuple[float, float]
+
+
+def parse_budgets(spec: str) -> Dict[str, Budget]:
+    """Parsing "event=rate/burst,..." (event "default" - all other events)"""
+    budgets = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        event, budget = item.split("=")
+        rate, burst = budget.split("/")
+        budgets[event.strip()] = (float(rate), float(burst))
+    return budgets
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class Slot:
+    """In-flight slot taken by expensive handler call"""
+
+    __slots__ = ("limiter", "held", "detached")
+
+    def __init__(self, limiter: "RateLimiter"):
+        self.limiter = limiter
+        self.held = True
+        self.detached = False
+        limiter.in_flight += 1
+
+    def release(self):
+        if self.held:
+            self.held = False
+            self.limiter.in_flight -= 1
+
+
+# Slot of the expensive handler running in current task
+current_slot: ContextVar[Optional[Slot]] = ContextVar("current_slot", default=None)
+
+
+class RateLimiter:
+    """
+    Token bucket per client key and event. Key is sid till client logs in
+    and address after it, so sockets of one address share the budget.
+    Memory per key is at most one bucket per event.
+    Expensive events also take a slot of global in-flight limit,
+    when all slots are busy the call is refused before doing any work.
+    """
+
+    def __init__(
+        self,
+        budgets: Dict[str, Budget],
+        expensive: Iterable[str] = (),
+        max_in_flight: int = 64,
+        skip: Iterable[str] = ("connect", "disconnect"),
+    ):
+        budgets = dict(budgets)
+        self.default: Optional[Budget] = budgets.pop("default", None)
+        self.budgets = budgets
+        self.expensive = frozenset(expensive)
+        self.max_in_flight = max_in_flight
+        self.skip = frozenset(skip)
+        self._buckets: Dict[str, Dict[str, TokenBucket]] = {}
+        self.in_flight = 0
+
+        self.limited = 0
+        self.shed = 0
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def check(self, key: str, event: str) -> Optional[float]:
+        """Taking token of event, returns seconds to wait if there is no one"""
+        budget = self.budgets.get(event, self.default)
+        if budget is None:
+            return None
+        rate, burst = budget
+        now = time.monotonic()
+        buckets = self._buckets.get(key)
+        if buckets is None:
+            buckets = self._buckets[key] = {}
+        bucket = buckets.get(event)
+        if bucket is None:
+            bucket = buckets[event] = TokenBucket(burst, now)
+        else:
+            bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return None
+        return (1 - bucket.tokens) / rate
+
+    def forget(self, key: str):
+        self._buckets.pop(key, None)
+
+    def detach_slot(self) -> Callable[[], None]:
+        """
+        Slot of running handler is kept after it returns (its work goes on
+        in background task), returned function releases it
+        """
+        slot = current_slot.get()
+        if slot is None:
+            return lambda: None
+        slot.detached = True
+        return slot.release
+
+    def guard(self, event: str, handler, key_of: Callable[[str], str]):
+        expensive = event in self.expensive
+
+        async def guarded(sid, *args):
+            retry_after = self.check(key_of(sid), event)
+            if retry_after is not None:
+                self.limited += 1
+                return (
+                    "rate_limit_error",
+                    {"event": event, "retry_after": round(retry_after, 3)},
+                )
+            if not expensive:
+                return await handler(sid, *args)
+
+            if self.in_flight >= self.max_in_flight:
+                self.shed += 1
+                return ("overload_error", {"event": event, "retry_after": 1})
+            slot = Slot(self)
+            token = current_slot.set(slot)
+            try:
+                return await handler(sid, *args)
+            finally:
+                current_slot.reset(token)
+                if not slot.detached:
+                    slot.release()
+
+        return guarded
+
+    def guard_server(self, sio, key_of: Callable[[str], str]):
+        """Guarding all handlers registered in Socket.IO server"""
+        for handlers in sio.handlers.values():
+            for event, handler in handlers.items():
+                if event not in self.skip:
+                    handlers[event] = self.guard(event, handler, key_of)
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._buckets),
+            "in_flight": self.in_flight,
+            "limited": self.limited,
+            "shed": self.shed,
+        }
@@ -0,0 +1,92 @@
+import math
+import random
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, List, Optional, Set, Tuple
+
+
+def bet_value(bet) -> float:
+    try:
+        value = float(bet)
+    except (TypeError, ValueError):
+        return 0.0
+    # NaN breaks ordering of sorted lists, inf bets are invalid too
+    return value if math.isfinite(value) else 0.0
+
+
+class RecommendationPool:
+    """
+    Listed battles kept in memory for recommendations.
+    Battles are sorted by bet in one list for all and one per NFT type,
+    so sample with NFT type and bet range filters is O(k + log n)
+    and does not touch DB.
+    """
+
+    def __init__(self):
+        # battle id -> serialised battle
+        self._battles: Dict[int, dict] = {}
+        # nft type (None - any) -> sorted (bet, battle id)
+        self._by_bet: Dict[Optional[int], List[Tuple[float, int]]] = {None: []}
+        self._by_owner: Dict[str, Set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._battles)
+
+    def __contains__(self, battle_id) -> bool:
+        return battle_id in self._battles
+
+    def add(self, dict_battle: dict):
+        battle_id = dict_battle["id"]
+        if battle_id in self._battles:
+            self.remove(battle_id)
+        self._battles[battle_id] = dict_battle
+        entry = (bet_value(dict_battle["bet"]), battle_id)
+        insort(self._by_bet[None], entry)
+        insort(self._by_bet.setdefault(int(dict_battle["nft_type"]), []), entry)
+        owner = dict_battle["owner_address"]
+        self._by_owner.setdefault(owner, set()).add(battle_id)
+
+    def remove(self, battle_id: int) -> Optional[dict]:
+        dict_battle = self._battles.pop(battle_id, None)
+        if dict_battle is None:
+            return None
+        entry = (bet_value(dict_battle["bet"]), battle_id)
+        for key in (None, int(dict_battle["nft_type"])):
+            entries = self._by_bet[key]
+            del entries[bisect_left(entries, entry)]
+        owner_ids = self._by_owner[dict_battle["owner_address"]]
+        owner_ids.discard(battle_id)
+        if not owner_ids:
+            del self._by_owner[dict_battle["owner_address"]]
+        return dict_battle
+
+    def sample(
+        self,
+        k: int,
+        exclude_owner: str = None,
+        nft_type: int = None,
+        min_bet: float = None,
+        max_bet: float = None,
+    ) -> List[dict]:
+        """Up to k random listed battles matching filters"""
+        entries = self._by_bet.get(None if nft_type is None else int(nft_type), [])
+        lo = 0 if min_bet is None else bisect_left(entries, (min_bet, -1))
+        hi = (
+            len(entries)
+            if max_bet is None
+            else bisect_right(entries, (max_bet, float("inf")))
+        )
+        if hi <= lo:
+            return []
+
+        # Own battles can be drawn too, so taking a bit more of them
+        own_count = len(self._by_owner.get(exclude_owner, ()))
+        indexes = random.sample(range(lo, hi), min(hi - lo, k + own_count))  # nosec
+        result = []
+        for index in indexes:
+            dict_battle = self._battles[entries[index][1]]
+            if dict_battle["owner_address"] == exclude_owner:
+                continue
+            result.append(dict_battle)
+            if len(result) == k:
+                break
+        return result
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import math
+import time
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional
+
+
+class _Timer:
+    __slots__ = ("key", "callback", "deadline", "rounds", "slot")
+
+    def __init__(self, key, callback, deadline: float, rounds: int, slot: int):
+        self.key = key
+        self.callback = callback
+        self.deadline = deadline
+        self.rounds = rounds
+        self.slot = slot
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel driven by one asyncio task.
+    Arm, re-arm and cancel are O(1), every tick only one slot is visited,
+    so thousands of per-round deadlines cost nothing while idle.
+    Timers are keyed (one live timer per key), callback is coroutine
+    function called with the key.
+    """
+
+    def __init__(self, tick: float = 0.1, slots: int = 512):
+        self.tick = tick
+        self._slots: List[Dict[Hashable, _Timer]] = [{} for _ in range(slots)]
+        self._timers: Dict[Hashable, _Timer] = {}
+        self._cursor = 0
+        self._task: Optional[asyncio.Task] = None
+
+        self.fired = 0
+        self.canceled = 0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    def __contains__(self, key) -> bool:
+        return key in self._timers
+
+    def arm(
+        self, key: Hashable, delay: float, callback: Callable[..., Awaitable]
+    ) -> None:
+        """Arming (or re-arming) timer firing `callback(key)` after delay"""
+        self._remove(key)
+        # +1 tick as current one is partly passed - timer never fires early
+        ticks = max(0, math.ceil(delay / self.tick)) + 1
+        slot = (self._cursor + ticks) % len(self._slots)
+        rounds = (ticks - 1) // len(self._slots)
+        timer = _Timer(key, callback, time.monotonic() + delay, rounds, slot)
+        self._slots[slot][key] = timer
+        self._timers[key] = timer
+
+    def cancel(self, key: Hashable) -> bool:
+        if self._remove(key):
+            self.canceled += 1
+            return True
+        return False
+
+    def _remove(self, key: Hashable) -> bool:
+        timer = self._timers.pop(key, None)
+        if timer is None:
+            return False
+        del self._slots[timer.slot][key]
+        return True
+
+    def _advance(self, now: float):
+        self._cursor = (self._cursor + 1) % len(self._slots)
+        slot = self._slots[self._cursor]
+        for key, timer in list(slot.items()):
+            if timer.rounds > 0:
+                timer.rounds -= 1
+                continue
+            del slot[key]
+            del self._timers[key]
+
+            lag = max(0.0, now - timer.deadline)
+            self.fired += 1
+            self.lag_total += lag
+            self.lag_max = max(self.lag_max, lag)
+            task = asyncio.ensure_future(timer.callback(key))
+            task.add_done_callback(self._log_error)
+
+    @staticmethod
+    def _log_error(task: asyncio.Future):
+        if not task.cancelled() and task.exception() is not None:
+            logging.error("Timer callback failed", exc_info=task.exception())
+
+    async def run(self):
+        """Task driving the wheel - catches up ticks missed under load"""
+        next_tick = time.monotonic() + self.tick
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            now = time.monotonic()
+            while next_tick <= now:
+                self._advance(now)
+                next_tick += self.tick
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self.run())
+        return self._task
+
+    def stats(self) -> dict:
+        return {
+            "armed": len(self._timers),
+            "fired": self.fired,
+            "canceled": self.canceled,
+            "lag_avg": self.lag_total / self.fired if self.fired else 0.0,
+            "lag_max": self.lag_max,
+        }
@@ -0,0 +1,57 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class Session:
+    __slots__ = ("address", "expires", "client")
+
+    def __init__(self, address: str, expires: float, client=None):
+        self.address = address
+        self.expires = expires
+        # Client object of the last socket (keeps state and current battle)
+        self.client = client
+
+
+class SessionCache:
+    """
+    Verified session keys cached in front of `session_keys` table.
+    Keeps client object of the session, so resumed socket gets
+    its state and battle back without DB or signature recovery.
+    """
+
+    def __init__(self, ttl: float = 86400, maxsize: int = 100000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def remember(self, session_key: str, address: str, client=None) -> Session:
+        session = Session(address, time.monotonic() + self.ttl, client)
+        self._sessions[session_key] = session
+        self._sessions.move_to_end(session_key)
+        if len(self._sessions) > self.maxsize:
+            self._sessions.popitem(last=False)
+        return session
+
+    def get(self, session_key: str) -> Optional[Session]:
+        session = self._sessions.get(session_key)
+        if session is None:
+            return None
+        if session.expires <= time.monotonic():
+            del self._sessions[session_key]
+            return None
+        return session
+
+    def forget(self, session_key: str):
+        self._sessions.pop(session_key, None)
+
+    def expire(self) -> int:
+        """Dropping expired sessions, returns how many were dropped"""
+        now = time.monotonic()
+        expired = [key for key, s in self._sessions.items() if s.expires <= now]
+        for session_key in expired:
+            del self._sessions[session_key]
+        return len(expired)